@@ -26,8 +26,9 @@ echo "Setting WebHook..."
 python management.py
 echo "WebHook has been set."
 
-# Start uvicorn:
-uvicorn webhook_main:app --host 0.0.0.0 --port 8080 --workers 4
+# Start uvicorn (WORKERS is also read by the settings to split POSTGRES_POOL_TOTAL_SIZE between the workers):
+export WORKERS="${WORKERS:-4}"
+uvicorn webhook_main:app --host 0.0.0.0 --port 8080 --workers "$WORKERS"
 
 # Evaluating passed command (do not touch):
 # shellcheck disable=SC2086
@@ -0,0 +1,108 @@
+import hmac
+from typing import Any, Literal, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+
+from content.middlewares.db_session import db_session_stats
+from data.config import settings
+from outbound.rate_limit import outbound_limiter
+from outbound.replies import reply_stats
+from repository.crud.cache import invalidator, row_caches
+from repository.crud.group_commit import group_committer
+from repository.crud.statements import statement_cache
+from repository.database import async_db
+from repository.query_stats import query_stats
+from updates.admission import admission_control
+from updates.dedup import update_deduplicator
+from updates.pipeline import update_pipeline
+from updates.stream import update_stream
+
+_metrics_secret = settings.METRICS_SECRET.encode() if settings.METRICS_SECRET else None
+
+
+def metrics_token_valid(x_metrics_token: Optional[str] = Header(default=None)) -> None:
+    """
+    Metrics are served on the public domain of the webhook, so only to requests with the X-Metrics-Token
+    header equal to METRICS_SECRET; without the secret configured they are not served at all
+    """
+    if _metrics_secret is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if x_metrics_token is None or not hmac.compare_digest(x_metrics_token.encode(), _metrics_secret):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+
+
+router = APIRouter(prefix="/metrics", tags=["metrics"], dependencies=[Depends(metrics_token_valid)])
+
+
+@router.get(path="/db-pool", status_code=status.HTTP_200_OK)
+async def db_pool() -> dict[str, Any]:
+    return async_db.pool_status()
+
+
+@router.get(path="/db-replicas", status_code=status.HTTP_200_OK)
+async def db_replicas() -> dict[str, Any]:
+    return async_db.replicas.stats()
+
+
+@router.get(path="/db-sessions", status_code=status.HTTP_200_OK)
+async def db_sessions() -> dict[str, Any]:
+    return db_session_stats.as_dict()
+
+
+@router.get(path="/group-commit", status_code=status.HTTP_200_OK)
+async def group_commit() -> dict[str, Any]:
+    return group_committer.stats()
+
+
+@router.get(path="/queries", status_code=status.HTTP_200_OK)
+async def queries(
+        limit: int = 20,
+        order_by: Literal["total_ms", "calls", "avg_ms", "max_ms"] = "total_ms",
+) -> dict[str, Any]:
+    return {
+        "slow_queries": query_stats.slow_queries,
+        "fingerprints": query_stats.top(limit=limit, order_by=order_by),
+    }
+
+
+@router.get(path="/statement-cache", status_code=status.HTTP_200_OK)
+async def statement_cache_stats() -> dict[str, Any]:
+    return statement_cache.stats()
+
+
+@router.get(path="/row-cache", status_code=status.HTTP_200_OK)
+async def row_cache() -> dict[str, Any]:
+    return {
+        "models": {model.__name__: cache.stats.as_dict() for model, cache in row_caches.items()},
+        "invalidations_received": invalidator.received,
+    }
+
+
+@router.get(path="/webhook-queue", status_code=status.HTTP_200_OK)
+async def webhook_queue() -> dict[str, Any]:
+    return update_pipeline.stats()
+
+
+@router.get(path="/dedup", status_code=status.HTTP_200_OK)
+async def dedup() -> dict[str, Any]:
+    return update_deduplicator.stats()
+
+
+@router.get(path="/update-stream", status_code=status.HTTP_200_OK)
+async def update_stream_stats() -> dict[str, Any]:
+    return await update_stream.stats()
+
+
+@router.get(path="/admission", status_code=status.HTTP_200_OK)
+async def admission() -> dict[str, Any]:
+    return admission_control.stats()
+
+
+@router.get(path="/bot-api", status_code=status.HTTP_200_OK)
+async def bot_api() -> dict[str, Any]:
+    return outbound_limiter.stats()
+
+
+@router.get(path="/replies", status_code=status.HTTP_200_OK)
+async def replies() -> dict[str, Any]:
+    return reply_stats.stats()
@@ -1,18 +1,119 @@
-from typing import Any
+import contextlib
+import hmac
+import logging
+from typing import Any, Dict, Optional
 
 from aiogram import types
-from fastapi import APIRouter, status
+from aiogram.methods import TelegramMethod
+from aiogram.types.update import UpdateTypeLookupError
+from fastapi import APIRouter, Request, Response, status
+from fastapi.responses import JSONResponse
+from pydantic import ValidationError
 
 from bot import dp, bot
 from data.config import settings
+from outbound.replies import send_reply, webhook_reply
+from updates.admission import Overloaded, admission_control
+from updates.dedup import update_deduplicator
+from updates.pipeline import update_pipeline
+from updates.stream import update_stream
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix=settings.WEBHOOK_PATH, tags=["webhooks"])
 
+# raw ASGI header name and the expected value, compared without building a Headers mapping
+SECRET_TOKEN_HEADER = b"x-telegram-bot-api-secret-token"
+_secret_token = settings.WEBHOOK_SECRET.encode() if settings.WEBHOOK_SECRET else None
+
+
+def secret_token_valid(request: Request) -> bool:
+    if _secret_token is None:
+        return True
+    for name, value in request.scope["headers"]:
+        if name == SECRET_TOKEN_HEADER:
+            return hmac.compare_digest(value, _secret_token)
+    return False
+
+
+def update_type(update: types.Update) -> str:
+    try:
+        return update.event_type
+    except UpdateTypeLookupError:
+        return "unknown"
+
+
+def parse_update(body: bytes) -> types.Update:
+    """
+    Validate the raw request body straight into an update (one pass, no intermediate dict),
+    mounted to the bot, so the dispatcher does not validate it again
+    """
+    return types.Update.model_validate_json(body, context={"bot": bot})
+
+
+async def accept_update(update: types.Update, response: Response) -> Optional[Dict[str, Any]]:
+    """
+    Handle the update (or queue it in the fast-ack mode) unless it is a redelivery.
+    Returns the body of the webhook response, if the handler's reply is to be sent in it.
+    """
+    if settings.UPDATE_DEDUP and await update_deduplicator.is_duplicate(update.update_id):
+        return None
+
+    if settings.WEBHOOK_FAST_ACK:
+        if update_pipeline.put_nowait(update):
+            # the update is answered with 200 now, Telegram does not redeliver it
+            if settings.UPDATE_DEDUP:
+                await update_deduplicator.complete(update.update_id)
+        else:
+            # Telegram redelivers the update later, it must not be taken for a duplicate then
+            if settings.UPDATE_DEDUP:
+                await update_deduplicator.forget(update.update_id)
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return None
+
+    handling = update_deduplicator.handling(update.update_id) if settings.UPDATE_DEDUP else contextlib.nullcontext()
+    try:
+        async with handling:
+            result = await dp.feed_webhook_update(bot=bot, update=update)
+    except Exception:
+        logger.exception(f"Update {update.update_id} failed")
+        return None
+
+    if not isinstance(result, TelegramMethod):
+        return None
+    reply = await webhook_reply(bot, result) if settings.WEBHOOK_REPLY_INLINE else None
+    if reply is None:
+        await send_reply(bot, result)
+    return reply
+
+
+@router.post(path="", status_code=status.HTTP_200_OK, response_model=None)
+async def webhook(request: Request, response: Response) -> Optional[Response]:
+    if not secret_token_valid(request):
+        response.status_code = status.HTTP_401_UNAUTHORIZED
+        return
+
+    if settings.UPDATE_STREAM:
+        # stream_main.py workers parse, deduplicate and handle it
+        if not await update_stream.append(await request.body()):
+            response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return
 
-@router.post(path="", status_code=status.HTTP_200_OK)
-async def webhook(update: dict[str, Any]) -> None:
     try:
-        await dp.feed_webhook_update(bot=bot, update=types.Update(**update))
-    except Exception as e:
-        # logging.exception(e)
-        pass
+        update = parse_update(await request.body())
+    except ValidationError as e:
+        # a redelivery would not fix it
+        logger.error(f"Invalid update is skipped: {e}")
+        return
+
+    try:
+        async with admission_control.admit(update_type(update)):
+            reply = await accept_update(update, response)
+    except Overloaded:
+        # shed before the deduplicator has seen it, so the redelivery is handled
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return
+
+    if reply is not None:
+        # Telegram calls the method in the response body, one Bot API round trip less
+        return JSONResponse(reply)
@@ -1,6 +1,8 @@
 from fastapi import APIRouter
+from api.endpoints.metrics import router as metrics_router
 from api.endpoints.webhooks import router as webhooks_router
 
 router = APIRouter()
 
 router.include_router(webhooks_router)
+router.include_router(metrics_router)
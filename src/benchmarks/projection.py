@@ -0,0 +1,70 @@
+"""
+Compare reading rows as ORM instances with column projections of `BaseCRUDRepository`.
+
+The benchmark loads `--rows` fake users (negative telegram ids) into the configured Postgres database
+inside a transaction, reads them `--repeat` times with every mode and rolls the transaction back,
+so the database is left untouched.
+
+Modes:
+    orm      `filter(...)`: full ORM instances, identity map bookkeeping for every row
+    rows     `filter(..., columns=[User.telegram_id, User.first_name])`: named tuples
+    scalars  `filter(..., columns=User.first_name)`: plain values of one column
+
+The identity map is cleared before every ORM read, so the numbers show the cost of building instances
+(which is what a fresh session of every update pays), not of finding them in the map.
+
+Run from the src directory:
+    python -m benchmarks.projection --rows 100000 --repeat 5
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from repository.crud.users import UserRepo
+from repository.database import async_db
+from repository.models.user import User
+
+
+async def measure(repo: UserRepo, repeat: int, **kwargs) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        repo.async_session.expunge_all()
+        started = time.perf_counter()
+        await repo.filter(User.telegram_id < 0, **kwargs)
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+async def main(rows: int, repeat: int) -> None:
+    async with async_db.async_session() as session:
+        repo = UserRepo(session)
+        await repo.bulk_create(
+            ({"telegram_id": -i, "first_name": f"user {i}"} for i in range(1, rows + 1)),
+            returning=False,
+            commit=False,
+        )
+
+        modes = {
+            "orm": {},
+            "rows": {"columns": [User.telegram_id, User.first_name]},
+            "scalars": {"columns": User.first_name},
+        }
+        results = {mode: await measure(repo, repeat, **kwargs) for mode, kwargs in modes.items()}
+        await session.rollback()
+
+    orm_median = statistics.median(results["orm"])
+    print(f"{rows} rows, {repeat} runs")
+    for mode, timings in results.items():
+        median = statistics.median(timings)
+        print(f"{mode:>8}: median {median * 1000:8.1f} ms, {rows / median:10.0f} rows/s, x{orm_median / median:.1f}")
+
+    await async_db.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.repeat))
@@ -0,0 +1,62 @@
+"""
+Compare the ways the webhook endpoint turns a request body into an aiogram `Update`.
+
+Modes:
+    dict   the former path: FastAPI decodes JSON into a dict, `types.Update(**update)` validates it,
+           and `feed_update` validates it once more (through `model_dump`) to mount it to the bot
+    json   `Update.model_validate_json(body, context={"bot": bot})`: one pass from bytes, already mounted
+
+Run from the src directory:
+    python -m benchmarks.webhook_parse --repeat 20000
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import Callable
+
+from aiogram import types
+
+from api.endpoints.webhooks import parse_update
+from bot import bot
+
+BODY = json.dumps({
+    "update_id": 123456789,
+    "message": {
+        "message_id": 42,
+        "date": 1700000000,
+        "chat": {"id": 1111111, "type": "private", "first_name": "Alice", "username": "alice"},
+        "from": {"id": 1111111, "is_bot": False, "first_name": "Alice", "username": "alice", "language_code": "en"},
+        "text": "/start",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+    },
+}).encode()
+
+
+def parse_dict(body: bytes) -> types.Update:
+    update = types.Update(**json.loads(body))
+    return types.Update.model_validate(update.model_dump(), context={"bot": bot})
+
+
+def measure(parse: Callable[[bytes], types.Update], repeat: int, rounds: int = 5) -> float:
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            parse(BODY)
+        timings.append((time.perf_counter() - started) / repeat)
+    return statistics.median(timings)
+
+
+def main(repeat: int) -> None:
+    assert parse_dict(BODY) == parse_update(BODY)
+    medians = {mode: measure(parse, repeat) for mode, parse in (("dict", parse_dict), ("json", parse_update))}
+    for mode, median in medians.items():
+        print(f"{mode:>6}: {median * 1e6:8.1f} us/update, {1 / median:10.0f} updates/s, x{medians['dict'] / median:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20_000)
+    args = parser.parse_args()
+    main(args.repeat)
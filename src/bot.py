@@ -3,9 +3,14 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.fsm.storage.redis import RedisStorage
 
 from data.config import settings
+from outbound.rate_limit import RateLimit
+from outbound.replies import CountSends
 from repository.redis import redis_client
 
 bot = Bot(token=settings.TOKEN, default=DefaultBotProperties(parse_mode='HTML'))
+bot.session.middleware(CountSends())
+if settings.BOT_RATE_LIMIT:
+    bot.session.middleware(RateLimit())
 
 storage = RedisStorage(redis=redis_client)
 dp = Dispatcher(storage=storage)
@@ -0,0 +1,32 @@
+import html
+import logging
+
+from aiogram import types, Router, F
+from aiogram.filters import Command
+from aiogram.methods import SendMessage
+
+from data.config import settings
+from repository.query_stats import query_stats
+
+router = Router()
+router.message.filter(F.from_user.id == settings.ADMIN_ID)
+
+logger = logging.getLogger(__name__)
+
+QUERIES_LIST_LIMIT = 10
+
+
+@router.message(Command("queries"))
+async def cmd_queries(message: types.Message) -> SendMessage:
+    top = query_stats.top(limit=QUERIES_LIST_LIMIT)
+    if not top:
+        return message.answer("No queries yet")
+
+    lines = [f"Slow queries: {query_stats.slow_queries}"]
+    for row in top:
+        lines.append(
+            f"<b>{row['calls']}</b> calls, total {row['total_ms']:.0f} ms, avg {row['avg_ms']:.1f} ms, "
+            f"p95 ≤{row['p95_ms']:.0f} ms, max {row['max_ms']:.0f} ms\n"
+            f"<code>{html.escape(row['fingerprint'][:300])}</code>"
+        )
+    return message.answer("\n\n".join(lines))
@@ -3,37 +3,46 @@ import logging
 from aiogram import types, Router
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from sqlalchemy.exc import NoResultFound
+from aiogram.methods import SendMessage
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from repository.crud.users import UserRepo
+from repository.models.user import User
 
 router = Router()
 
 logger = logging.getLogger(__name__)
 
+USERS_LIST_LIMIT = 50
+
 
 @router.message(Command("start"))
-async def cmd_start(message: types.Message, state: FSMContext, session: AsyncSession) -> None:
+async def cmd_start(message: types.Message, state: FSMContext, session: AsyncSession) -> SendMessage:
     current_state = await state.get_state()
     await message.answer(f"Hi, Im started! Current state is {current_state}")
 
     user_repo = UserRepo(session)
-    try:
-        user = await user_repo.get(telegram_id=message.from_user.id)
-    except NoResultFound:
-        user = await user_repo.create(
+    # a returning user is read from the row cache: the upsert writes (and locks) the row on every call
+    user = await user_repo.get_or_none(telegram_id=message.from_user.id)
+    if user is None:
+        user, _ = await user_repo.get_or_create(
             telegram_id=message.from_user.id,
-            username=message.from_user.username,
-            first_name=message.from_user.first_name,
-            last_name=message.from_user.last_name,
+            defaults=dict(
+                username=message.from_user.username,
+                first_name=message.from_user.first_name,
+                last_name=message.from_user.last_name,
+            ),
         )
     await message.answer(f"Hello, {user.username}!")
 
-    all_users = await user_repo.all()
-    ans_users = [u.first_name for u in all_users]
-    await message.answer(f"All users in bot:\n{', '.join(ans_users)}")
+    # the first page only: the whole table does not fit into memory (and into a message)
+    users_page = await user_repo.paginate(limit=USERS_LIST_LIMIT, columns=User.first_name)
+    ans_users = list(users_page.items)
+    if users_page.next_token is not None:
+        ans_users.append("...")
     logger.warning(f"Test log message. List users: {ans_users}")
+    # the last reply is returned, not awaited: in webhook mode it is sent in the webhook response
+    return message.answer(f"All users in bot:\n{', '.join(ans_users)}")
 
 # States can be set:
 # async def set_state(message: types.Message, state: FSMContext) -> None:
@@ -1,8 +1,10 @@
 from aiogram import Router
 
+from .admin.handlers import router as admin_router
 from .basic.handlers import router as basic_router
 
 main_router = Router()
 main_router.include_routers(
+    admin_router,
     basic_router,
 )
@@ -1,9 +1,82 @@
-from typing import Callable, Awaitable, Dict, Any
+import logging
+import time
+from typing import Callable, Awaitable, Dict, Any, Optional
 
 from aiogram import BaseMiddleware
 from aiogram.types.base import TelegramObject
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from repository.utils import create_async_session
+from repository.database import async_db
+
+logger = logging.getLogger(__name__)
+
+
+class DbSessionStats:
+    def __init__(self):
+        self.updates = 0
+        self.sessions_used = 0
+        self.connection_seconds = 0.0
+        self.max_connection_seconds = 0.0
+
+    def observe(self, used: bool, connection_seconds: float) -> None:
+        self.updates += 1
+        if not used:
+            return
+        self.sessions_used += 1
+        self.connection_seconds += connection_seconds
+        self.max_connection_seconds = max(self.max_connection_seconds, connection_seconds)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "updates": self.updates,
+            "sessions_used": self.sessions_used,
+            "sessions_skipped": self.updates - self.sessions_used,
+            "avg_connection_ms": self.connection_seconds / self.sessions_used * 1000 if self.sessions_used else 0.0,
+            "max_connection_ms": self.max_connection_seconds * 1000,
+        }
+
+
+db_session_stats: DbSessionStats = DbSessionStats()
+
+
+class LazySession:
+    """
+    Stands in for an `AsyncSession`: the real session is created on the first attribute access,
+    so updates whose handlers never touch the database do not cost a session or a pool connection.
+    Keeps track of how long the session held a connection (from the beginning of a transaction
+    till its commit, rollback or close).
+    """
+
+    def __init__(self, session_factory: async_sessionmaker = async_db.async_session):
+        self._session_factory = session_factory
+        self._session: Optional[AsyncSession] = None
+        self._connection_started: Optional[float] = None
+        self.connection_seconds = 0.0
+
+    @property
+    def used(self) -> bool:
+        return self._session is not None
+
+    def __getattr__(self, name: str) -> Any:
+        if self._session is None:
+            self._session = self._session_factory()
+            event.listen(self._session.sync_session, "after_begin", self._on_begin)
+            event.listen(self._session.sync_session, "after_transaction_end", self._on_transaction_end)
+        return getattr(self._session, name)
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    def _on_begin(self, session, transaction, connection) -> None:
+        if self._connection_started is None:
+            self._connection_started = time.perf_counter()
+
+    def _on_transaction_end(self, session, transaction) -> None:
+        if transaction.parent is None and self._connection_started is not None:
+            self.connection_seconds += time.perf_counter() - self._connection_started
+            self._connection_started = None
 
 
 class DbSession(BaseMiddleware):
@@ -13,6 +86,16 @@ class DbSession(BaseMiddleware):
             event: TelegramObject,
             data: Dict[str, Any],
     ) -> Any:
-        async for async_session in create_async_session():
-            data['session'] = async_session
+        session = LazySession()
+        data['session'] = session
+        try:
             return await handler(event, data)
+        finally:
+            # the connection goes back to the pool as soon as the handler is done with it
+            await session.close()
+            db_session_stats.observe(session.used, session.connection_seconds)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    f"Update {getattr(event, 'update_id', None)}: db session used={session.used}, "
+                    f"connection held {session.connection_seconds * 1000:.1f} ms"
+                )
@@ -0,0 +1,34 @@
+from typing import Callable, Awaitable, Dict, Any
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+from aiogram.types.base import TelegramObject
+
+from updates.dedup import REDELIVERED, UpdateDeduplicator, update_deduplicator
+
+
+class Deduplicate(BaseMiddleware):
+    """
+    Outer update middleware dropping redelivered updates (used by polling and stream workers,
+    the webhook checks before queueing). Updates marked with `REDELIVERED` are dropped only if handled.
+    """
+
+    def __init__(self, deduplicator: UpdateDeduplicator = update_deduplicator):
+        self.deduplicator = deduplicator
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        if data.get(REDELIVERED):
+            duplicate = await self.deduplicator.is_handled(event.update_id)
+        else:
+            duplicate = await self.deduplicator.is_duplicate(event.update_id)
+        if duplicate:
+            return None
+        async with self.deduplicator.handling(event.update_id):
+            return await handler(event, data)
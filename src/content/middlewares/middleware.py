@@ -1,8 +1,17 @@
 from aiogram import Dispatcher
 from .db_session import DbSession
+from .query_budget import QueryBudget, QueryBudgetHandlerTag
+from .reply import ReplyInlineOptOut
 
 
 def register_middlewares(dp: Dispatcher) -> None:
     # import and add your middlewares, for example:
+    dp.update.middleware.register(QueryBudget())
     dp.update.middleware.register(DbSession())
 
+    handler_tag = QueryBudgetHandlerTag()
+    reply_opt_out = ReplyInlineOptOut()
+    for event_name, observer in dp.observers.items():
+        if event_name not in ("update", "error"):
+            observer.middleware.register(handler_tag)
+            observer.middleware.register(reply_opt_out)
@@ -0,0 +1,82 @@
+import logging
+from typing import Callable, Awaitable, Dict, Any, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.types.base import TelegramObject
+
+from data.config import settings
+from repository.query_stats import (
+    QueryBudgetExceeded,
+    QueryRecorder,
+    check_query_budget,
+    current_recorder,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateQueries(QueryRecorder):
+    def __init__(self):
+        super().__init__()
+        self.handler: Optional[str] = None
+
+
+class QueryBudget(BaseMiddleware):
+    """
+    Counts SQL statements and the database time of every update and warns when they exceed the budget,
+    or when one statement fingerprint repeats (an N+1 loop). In strict mode (tests) the update fails instead.
+    """
+
+    def __init__(
+            self,
+            max_statements: Optional[int] = settings.QUERY_BUDGET_STATEMENTS,
+            max_ms: Optional[float] = settings.QUERY_BUDGET_MS,
+            max_repeats: Optional[int] = settings.QUERY_BUDGET_REPEATS,
+            strict: bool = settings.QUERY_BUDGET_STRICT,
+    ):
+        self.max_statements = max_statements
+        self.max_ms = max_ms
+        self.max_repeats = max_repeats
+        self.strict = strict
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        queries = UpdateQueries()
+        token = current_recorder.set(queries)
+        try:
+            result = await handler(event, data)
+        finally:
+            current_recorder.reset(token)
+
+        problems = check_query_budget(queries, self.max_statements, self.max_ms, self.max_repeats)
+        if problems:
+            message = (
+                f"Update {getattr(event, 'update_id', None)} handled by {queries.handler}: " + "; ".join(problems)
+            )
+            if self.strict:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return result
+
+
+class QueryBudgetHandlerTag(BaseMiddleware):
+    """
+    Inner middleware, which tells `QueryBudget` what handler the update was routed to
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        queries = current_recorder.get()
+        handler_object: Optional[HandlerObject] = data.get("handler")
+        if isinstance(queries, UpdateQueries) and handler_object is not None:
+            queries.handler = handler_object.callback.__qualname__
+        return await handler(event, data)
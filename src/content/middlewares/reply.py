@@ -0,0 +1,28 @@
+from typing import Callable, Awaitable, Dict, Any
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.methods import TelegramMethod
+from aiogram.types.base import TelegramObject
+
+from outbound.replies import REPLY_INLINE_FLAG, reply_stats, send_reply
+
+
+class ReplyInlineOptOut(BaseMiddleware):
+    """
+    Inner middleware: the method returned by a handler flagged with `reply_inline=False` is sent
+    at once as a Bot API call instead of being returned in the webhook response
+    """
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        result = await handler(event, data)
+        if get_flag(data, REPLY_INLINE_FLAG, default=True) is False and isinstance(result, TelegramMethod):
+            reply_stats.opted_out += 1
+            await send_reply(data["bot"], result)
+            return None
+        return result
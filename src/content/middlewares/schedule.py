@@ -0,0 +1,50 @@
+import logging
+from typing import Callable, Awaitable, Dict, Any
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.bases import UNHANDLED
+from aiogram.types import Update
+from aiogram.types.base import TelegramObject
+
+from updates.scheduler import UpdateScheduler, update_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class Schedule(BaseMiddleware):
+    """
+    Outer update middleware for polling: the rest of the update handling is run by the scheduler,
+    so updates of one chat are handled in order and different chats in parallel.
+    Must be the first of our outer middlewares and the updates must be fed one by one
+    (`start_polling(handle_as_tasks=False)`), so they are scheduled in the order they arrived.
+    """
+
+    def __init__(self, scheduler: UpdateScheduler = update_scheduler):
+        self.scheduler = scheduler
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        await self.scheduler.put(event, lambda: self._process(handler, event, data))
+        # the update is only scheduled, None (not UNHANDLED) keeps the dispatcher from logging it as not handled
+        return None
+
+    @staticmethod
+    async def _process(
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: Update,
+            data: Dict[str, Any],
+    ) -> Any:
+        if "state" in data:
+            # the state was read when the update was scheduled, earlier updates of the chat may have changed it
+            data["raw_state"] = await data["state"].get_state()
+        result = await handler(event, data)
+        if result is UNHANDLED:
+            logger.debug(f"Update id={event.update_id} is not handled")
+            return None
+        return result
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Literal, Optional
 
 from pydantic import (
     Field,
@@ -20,12 +21,90 @@ class Settings(BaseSettings):
     # app settings
     DOMAIN: str
     WEBHOOK_PATH: str
+    # Sent by Telegram in the X-Telegram-Bot-Api-Secret-Token header, requests without it are rejected
+    WEBHOOK_SECRET: Optional[str] = None
+    # Required in the X-Metrics-Token header of /metrics/* requests, metrics are not served without it
+    METRICS_SECRET: Optional[str] = None
     DEBUG: bool = False
 
+    # Fast-ack webhook: updates are queued (up to WEBHOOK_QUEUE_SIZE per worker process) and answered at once,
+    # WEBHOOK_QUEUE_WORKERS tasks handle them. On shutdown the queue is drained for WEBHOOK_QUEUE_DRAIN_TIMEOUT s
+    WEBHOOK_FAST_ACK: bool = False
+    WEBHOOK_QUEUE_SIZE: int = 1000
+    WEBHOOK_QUEUE_WORKERS: int = 16
+    WEBHOOK_QUEUE_DRAIN_TIMEOUT: float = 10.0
+
+    # A method returned by a handler (`return message.answer(...)`) is sent in the webhook response,
+    # saving a Bot API call (only when the update is handled within the request, not with fast-ack or streams)
+    WEBHOOK_REPLY_INLINE: bool = True
+
+    # Admission control of one worker process: at most WEBHOOK_MAX_IN_FLIGHT webhook updates are handled at once
+    # (no limit if unset), up to WEBHOOK_MAX_WAITING more wait at most WEBHOOK_MAX_QUEUE_WAIT s for a slot,
+    # the rest are answered with 503 and redelivered by Telegram later. Free slots go to update types with
+    # the lowest WEBHOOK_UPDATE_PRIORITIES number first (WEBHOOK_DEFAULT_PRIORITY for types not listed)
+    WEBHOOK_MAX_IN_FLIGHT: Optional[int] = None
+    WEBHOOK_MAX_WAITING: int = 100
+    WEBHOOK_MAX_QUEUE_WAIT: float = 1.0
+    WEBHOOK_UPDATE_PRIORITIES: dict[str, int] = {
+        "message": 0,
+        "callback_query": 0,
+        "pre_checkout_query": 0,
+        "edited_message": 2,
+        "inline_query": 2,
+        "chosen_inline_result": 2,
+    }
+    WEBHOOK_DEFAULT_PRIORITY: int = 1
+
+    # Per-chat ordered handling (fast-ack webhook and polling): updates are hashed by chat into UPDATE_SHARDS
+    # queues of UPDATE_SHARD_QUEUE_SIZE updates, one chat may have UPDATE_CHAT_QUEUE_SIZE of them queued.
+    # 0 shards - an unordered pool of WEBHOOK_QUEUE_WORKERS (webhook) or a task per update (polling)
+    UPDATE_SHARDS: int = 0
+    UPDATE_SHARD_QUEUE_SIZE: int = 100
+    UPDATE_CHAT_QUEUE_SIZE: int = 20
+
+    # Durable ingestion: the webhook only appends raw updates to the UPDATE_STREAM_NAME Redis Stream (trimmed
+    # to about UPDATE_STREAM_MAXLEN entries), stream_main.py workers handle them through the consumer group,
+    # UPDATE_STREAM_CONCURRENCY at a time. Entries not acknowledged for UPDATE_STREAM_CLAIM_IDLE_MS are reclaimed,
+    # after UPDATE_STREAM_MAX_DELIVERIES deliveries they are moved to "<name>:dead". Consumers without pending
+    # entries idle for UPDATE_STREAM_CONSUMER_IDLE_MS (workers that are gone) are deleted from the group.
+    # UPDATE_STREAM_CONSUMER defaults to "<hostname>-<pid>"
+    UPDATE_STREAM: bool = False
+    UPDATE_STREAM_NAME: str = "updates:stream"
+    UPDATE_STREAM_GROUP: str = "workers"
+    UPDATE_STREAM_CONSUMER: Optional[str] = None
+    UPDATE_STREAM_MAXLEN: int = 100_000
+    UPDATE_STREAM_CONCURRENCY: int = 16
+    UPDATE_STREAM_BLOCK_MS: int = 5000
+    UPDATE_STREAM_CLAIM_IDLE_MS: int = 60_000
+    UPDATE_STREAM_MAX_DELIVERIES: int = 5
+    UPDATE_STREAM_CONSUMER_IDLE_MS: int = 60 * 60 * 1000
+
+    # Drop redelivered updates: ids are claimed in Redis for UPDATE_DEDUP_LEASE seconds (renewed while
+    # the update is handled, so a crashed worker does not block the redelivery for long) and kept
+    # for UPDATE_DEDUP_TTL seconds once handled, the last UPDATE_DEDUP_RING_SIZE ids are also remembered
+    # by every process
+    UPDATE_DEDUP: bool = True
+    UPDATE_DEDUP_LEASE: int = 15
+    UPDATE_DEDUP_TTL: int = 60 * 60
+    UPDATE_DEDUP_RING_SIZE: int = 10_000
+
     # src settings
     TOKEN: str
     ADMIN_ID: int
 
+    # Outbound Bot API rate limits shared by all processes through Redis (messages per second and burst):
+    # the whole bot, one private chat, one group or channel. Flood control errors (retry_after) are retried
+    # BOT_RETRY_ATTEMPTS times, waits are stretched by a random share of up to BOT_RATE_JITTER (0.1 - 10%)
+    BOT_RATE_LIMIT: bool = True
+    BOT_RATE_GLOBAL: float = 30.0
+    BOT_RATE_GLOBAL_BURST: int = 30
+    BOT_RATE_CHAT: float = 1.0
+    BOT_RATE_CHAT_BURST: int = 3
+    BOT_RATE_GROUP: float = 20 / 60
+    BOT_RATE_GROUP_BURST: int = 5
+    BOT_RATE_JITTER: float = 0.1
+    BOT_RETRY_ATTEMPTS: int = 3
+
     # Redis settings
     REDIS_HOST: str
     REDIS_PASSWORD: str
@@ -38,6 +117,47 @@ class Settings(BaseSettings):
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
 
+    # Postgres connection pool settings (of one worker process).
+    # If POSTGRES_POOL_TOTAL_SIZE is set, it is the connection budget of all WORKERS
+    # (keep it below max_connections of the server), and the per-worker sizes are derived from it
+    WORKERS: int = 1
+    POSTGRES_POOL_SIZE: int = 5
+    POSTGRES_POOL_MAX_OVERFLOW: int = 10
+    POSTGRES_POOL_TOTAL_SIZE: Optional[int] = None
+    POSTGRES_POOL_TIMEOUT: float = 30.0
+    POSTGRES_POOL_RECYCLE: int = 30 * 60
+    POSTGRES_POOL_PRE_PING: bool = True
+    POSTGRES_STATEMENT_CACHE_SIZE: int = 100
+    # Connections opened (and prepared with the hot statements of the repositories) on startup
+    POSTGRES_POOL_WARMUP_SIZE: int = 2
+
+    # Read replicas ("host" or "host:port", same database and credentials as the primary).
+    # Reads are spread between healthy replicas by "round_robin" or "least_connections"
+    POSTGRES_REPLICA_HOSTS: list[str] = []
+    POSTGRES_REPLICA_STRATEGY: Literal["round_robin", "least_connections"] = "round_robin"
+    POSTGRES_REPLICA_HEALTH_CHECK_INTERVAL: float = 5.0
+    POSTGRES_REPLICA_HEALTH_CHECK_TIMEOUT: float = 2.0
+
+    # Row cache settings (in-process layer in front of the Redis row cache)
+    ROW_CACHE_LOCAL_MAX_ENTRIES: int = 10_000
+    ROW_CACHE_LOCAL_MAX_BYTES: int = 16 * 1024 * 1024
+    ROW_CACHE_INVALIDATION_CHANNEL: str = "crud:row-cache:invalidate"
+
+    # Statements slower than this (ms) are logged with redacted parameters
+    SLOW_QUERY_MS: float = 200.0
+
+    # Per-update query budget: warn (or fail in strict mode, for tests) when an update executes more statements,
+    # spends more time in the database (ms) or repeats one statement more times than this
+    QUERY_BUDGET_STATEMENTS: Optional[int] = 10
+    QUERY_BUDGET_MS: Optional[float] = 200.0
+    QUERY_BUDGET_REPEATS: Optional[int] = 3
+    QUERY_BUDGET_STRICT: bool = False
+
+    # Group commit of repositories with `group_commit = True`: writes arriving within the window
+    # (seconds) or until the batch is full share one transaction
+    GROUP_COMMIT_WINDOW: float = 0.005
+    GROUP_COMMIT_MAX_BATCH: int = 100
+
     @property
     def redis_url(self) -> RedisDsn:
         return RedisDsn.build(
@@ -58,6 +178,33 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DATABASE
         )
 
+    @property
+    def postgres_replica_dsns(self) -> list[PostgresDsn]:
+        dsns = []
+        for replica in self.POSTGRES_REPLICA_HOSTS:
+            host, _, port = replica.partition(":")
+            dsns.append(PostgresDsn.build(
+                scheme="postgresql",
+                username=self.POSTGRES_USER,
+                password=self.POSTGRES_PASSWORD,
+                host=host,
+                port=int(port) if port else self.POSTGRES_PORT,
+                path=self.POSTGRES_DATABASE
+            ))
+        return dsns
+
+    @property
+    def postgres_pool_sizing(self) -> tuple[int, int]:
+        """
+        Pool size and max overflow of one worker process. A quarter of the per-worker share
+        of the total budget is left for overflow connections, which are closed when returned.
+        """
+        if self.POSTGRES_POOL_TOTAL_SIZE is None:
+            return self.POSTGRES_POOL_SIZE, self.POSTGRES_POOL_MAX_OVERFLOW
+        per_worker = max(self.POSTGRES_POOL_TOTAL_SIZE // max(self.WORKERS, 1), 1)
+        pool_size = max(per_worker * 3 // 4, 1)
+        return pool_size, per_worker - pool_size
+
     @property
     def set_app_attributes(self) -> dict[str, str | bool | None]:
         """
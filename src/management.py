@@ -6,8 +6,11 @@ from aiogram.types import WebhookInfo
 
 from bot import bot
 from data.config import settings
+from repository.crud.cache import invalidator
+from repository.crud.group_commit import group_committer
 from repository.database import async_db
 from repository.events import inspect_db_server_on_connection, inspect_db_server_on_close  # type: ignore
+from repository.warmup import warm_up_database
 
 loger = logging.getLogger(__name__)
 
@@ -16,11 +19,17 @@ async def app_start_with() -> None:
     async with async_db.async_engine.connect():
         # check connection
         pass
+    await warm_up_database()
+    invalidator.start()
+    async_db.replicas.start()
 
 
 async def app_stop_with() -> None:
+    await group_committer.drain()
+    await invalidator.stop()
+    await async_db.replicas.stop()
     await bot.session.close()
-    await async_db.async_engine.dispose()
+    await async_db.dispose()
 
 
 async def set_webhook_on_startup() -> None:
@@ -37,6 +46,7 @@ async def set_webhook_on_startup() -> None:
         print("YES")
         await bot.set_webhook(
             url=webhook_url,
+            secret_token=settings.WEBHOOK_SECRET,
             # allowed_updates=["message", "callback_query"]
         )
     await bot.session.close()
@@ -0,0 +1,252 @@
+import asyncio
+import bisect
+import logging
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from data.config import settings
+from repository.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the queue wait histogram buckets, ms (the last bucket is unbounded)
+WAIT_BUCKETS_MS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Bot API methods that send a message to a chat and count towards the flood limits
+LIMITED_METHOD_PREFIXES = ("send", "forward", "copy")
+# ...except the ones that do not send a message
+UNLIMITED_METHODS = frozenset({"sendChatAction"})
+
+# Takes a token from every bucket (KEYS, ARGV are rate and burst pairs) if all of them have one,
+# otherwise takes nothing and returns the seconds to wait. Buckets live in hashes: tokens, ts, blocked_until.
+_ACQUIRE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local wait = 0
+local levels = {}
+for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[i * 2 - 1]), tonumber(ARGV[i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts', 'blocked_until')
+    local level = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    local blocked_until = tonumber(state[3]) or 0
+    level = math.min(burst, level + math.max(0, now - ts) * rate)
+    levels[i] = level
+    if blocked_until > now then
+        wait = math.max(wait, blocked_until - now)
+    end
+    if level < 1 then
+        wait = math.max(wait, (1 - level) / rate)
+    end
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local rate, burst = tonumber(ARGV[i * 2 - 1]), tonumber(ARGV[i * 2])
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - 1), 'ts', tostring(now))
+    local ttl = math.ceil(burst / rate) + 60
+    if redis.call('TTL', key) < ttl then
+        redis.call('EXPIRE', key, ttl)
+    end
+end
+return '0'
+"""
+
+# Blocks the bucket (KEYS[1]) for ARGV[1] seconds, after Telegram answered with retry_after
+_BLOCK_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local blocked_until = now + tonumber(ARGV[1])
+if blocked_until > (tonumber(redis.call('HGET', KEYS[1], 'blocked_until')) or 0) then
+    redis.call('HSET', KEYS[1], 'blocked_until', tostring(blocked_until))
+end
+local ttl = math.ceil(tonumber(ARGV[1])) + 60
+if redis.call('TTL', KEYS[1]) < ttl then
+    redis.call('EXPIRE', KEYS[1], ttl)
+end
+"""
+
+ChatId = Union[int, str]
+
+
+def sends_message(method: TelegramMethod[Any]) -> bool:
+    """
+    Whether the method sends a message and takes a token of the rate limiter (edits and chat actions do not)
+    """
+    api_method = method.__api_method__
+    return api_method.startswith(LIMITED_METHOD_PREFIXES) and api_method not in UNLIMITED_METHODS
+
+
+class OutboundRateLimiter:
+    """
+    Token buckets in Redis shared by all processes of the bot: a global one (`global_rate` messages
+    per second), one per private chat (`chat_rate`) and one per group or channel (`group_rate`),
+    each with its burst. A request waits until every bucket it belongs to has a token; a chat or the whole
+    bot answered with retry_after is blocked for that long for every process.
+    If Redis is unavailable, requests are not limited.
+    """
+
+    def __init__(
+            self,
+            redis: Redis = redis_client,
+            global_rate: float = settings.BOT_RATE_GLOBAL,
+            global_burst: int = settings.BOT_RATE_GLOBAL_BURST,
+            chat_rate: float = settings.BOT_RATE_CHAT,
+            chat_burst: int = settings.BOT_RATE_CHAT_BURST,
+            group_rate: float = settings.BOT_RATE_GROUP,
+            group_burst: int = settings.BOT_RATE_GROUP_BURST,
+            jitter: float = settings.BOT_RATE_JITTER,
+            prefix: str = "bot:rate",
+    ):
+        self.redis = redis
+        self.global_limit = (global_rate, global_burst)
+        self.chat_limit = (chat_rate, chat_burst)
+        self.group_limit = (group_rate, group_burst)
+        self.jitter = jitter
+        self.prefix = prefix
+        self.acquired = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.blocks = 0
+        self.errors = 0
+        self._acquire = redis.register_script(_ACQUIRE_SCRIPT)
+        self._block = redis.register_script(_BLOCK_SCRIPT)
+
+    def buckets(self, chat_id: Optional[ChatId]) -> List[Tuple[str, Tuple[float, int]]]:
+        buckets = [(f"{self.prefix}:global", self.global_limit)]
+        if chat_id is None:
+            return buckets
+        # private chats have positive ids, groups negative ones, channels may be addressed by @username
+        if isinstance(chat_id, int) and chat_id > 0:
+            buckets.append((f"{self.prefix}:chat:{chat_id}", self.chat_limit))
+        else:
+            buckets.append((f"{self.prefix}:group:{chat_id}", self.group_limit))
+        return buckets
+
+    async def acquire(self, chat_id: Optional[ChatId]) -> float:
+        """
+        Wait for a token of the chat and of the bot, return the seconds waited
+        """
+        buckets = self.buckets(chat_id)
+        keys = [key for key, _ in buckets]
+        args = [value for _, limit in buckets for value in limit]
+        started = time.perf_counter()
+        while True:
+            try:
+                wait = float(await self._acquire(keys=keys, args=args))
+            except RedisError as e:
+                self.errors += 1
+                logger.warning(f"Outbound rate limit check failed, the request is not limited: {e}")
+                break
+            if wait <= 0:
+                break
+            # processes waiting for one bucket must not wake up all at once
+            await asyncio.sleep(self.jittered(wait))
+
+        waited = time.perf_counter() - started
+        self._observe(waited)
+        return waited
+
+    async def try_acquire(self, chat_id: Optional[ChatId]) -> bool:
+        """
+        Take a token of the chat and of the bot if there are both, without waiting
+        """
+        buckets = self.buckets(chat_id)
+        try:
+            wait = float(await self._acquire(
+                keys=[key for key, _ in buckets], args=[value for _, limit in buckets for value in limit]
+            ))
+        except RedisError as e:
+            self.errors += 1
+            logger.warning(f"Outbound rate limit check failed, the request is not limited: {e}")
+            return True
+        if wait > 0:
+            return False
+        self._observe(0.0)
+        return True
+
+    def jittered(self, seconds: float) -> float:
+        """
+        Stretch the wait by a random share of up to `jitter`, so the jitter is small for short waits
+        """
+        return seconds * (1 + random.uniform(0, self.jitter))
+
+    async def block(self, chat_id: Optional[ChatId], seconds: float) -> None:
+        """
+        Block the chat (the whole bot if there is no chat) for every process, after a retry_after answer
+        """
+        self.blocks += 1
+        key = self.buckets(chat_id)[-1][0]
+        try:
+            await self._block(keys=[key], args=[seconds])
+        except RedisError as e:
+            self.errors += 1
+            logger.warning(f"Outbound rate limit block of {key} failed: {e}")
+
+    def _observe(self, seconds: float) -> None:
+        self.acquired += 1
+        if seconds * 1000 >= WAIT_BUCKETS_MS[0]:
+            self.waited += 1
+        self.wait_seconds += seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+        self.wait_buckets[bisect.bisect_left(WAIT_BUCKETS_MS, seconds * 1000)] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "acquired": self.acquired,
+            "waited": self.waited,
+            "avg_wait_ms": self.wait_seconds / self.acquired * 1000 if self.acquired else 0.0,
+            "max_wait_ms": self.max_wait_seconds * 1000,
+            "wait_histogram": dict(zip([*map(str, WAIT_BUCKETS_MS), "inf"], self.wait_buckets)),
+            "retry_after_blocks": self.blocks,
+            "errors": self.errors,
+        }
+
+
+outbound_limiter: OutboundRateLimiter = OutboundRateLimiter()
+
+
+class RateLimit(BaseRequestMiddleware):
+    """
+    Bot session middleware: messages wait for the outbound rate limiter, a request answered with
+    retry_after is retried after that time (plus jitter) up to `attempts` times, so the flood control error
+    does not reach handlers
+    """
+
+    def __init__(self, limiter: OutboundRateLimiter = outbound_limiter, attempts: int = settings.BOT_RETRY_ATTEMPTS):
+        self.limiter = limiter
+        self.attempts = attempts
+
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType[TelegramType],
+            bot: Bot,
+            method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        limited = sends_message(method)
+        chat_id = getattr(method, "chat_id", None)
+        attempt = 1
+        while True:
+            if limited:
+                await self.limiter.acquire(chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt >= self.attempts:
+                    raise
+                logger.warning(f"{e.message.splitlines()[0]} (attempt {attempt} of {self.attempts})")
+                await self.limiter.block(chat_id, e.retry_after)
+                await asyncio.sleep(self.limiter.jittered(e.retry_after))
+                attempt += 1
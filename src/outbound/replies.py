@@ -0,0 +1,93 @@
+import logging
+from typing import Any, Dict, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import InputFile
+
+from data.config import settings
+from outbound.rate_limit import OutboundRateLimiter, outbound_limiter, sends_message
+
+logger = logging.getLogger(__name__)
+
+# handler flag: `@router.message(Command("report"), flags={REPLY_INLINE_FLAG: False})` sends the method
+# the handler returns as a separate Bot API call, not in the webhook response
+REPLY_INLINE_FLAG = "reply_inline"
+
+
+class ReplyStats:
+    """
+    How messages reach Telegram: in webhook responses (inline) or as Bot API calls (outbound)
+    """
+
+    def __init__(self):
+        self.inline = 0
+        self.outbound = 0
+        self.returned_outbound = 0
+        self.opted_out = 0
+
+    def stats(self) -> Dict[str, Any]:
+        sent = self.inline + self.outbound
+        return {
+            "inline": self.inline,
+            "outbound": self.outbound,
+            # methods returned by handlers, which could not be answered inline (files, background handling)
+            "returned_outbound": self.returned_outbound,
+            "opted_out": self.opted_out,
+            "inline_share": self.inline / sent if sent else 0.0,
+        }
+
+
+reply_stats: ReplyStats = ReplyStats()
+
+
+class CountSends(BaseRequestMiddleware):
+    """
+    Bot session middleware counting outbound calls of the methods that send a message to a chat
+    """
+
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType[TelegramType],
+            bot: Bot,
+            method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if sends_message(method):
+            reply_stats.outbound += 1
+        return await make_request(bot, method)
+
+
+async def webhook_reply(
+        bot: Bot,
+        method: TelegramMethod[Any],
+        limiter: Optional[OutboundRateLimiter] = outbound_limiter if settings.BOT_RATE_LIMIT else None,
+) -> Optional[Dict[str, Any]]:
+    """
+    JSON body of the webhook response calling `method`, or None if it can't be sent this way: it uploads
+    files (they need a multipart request) or the rate limiter has no token for it right now (a webhook
+    response bypasses the bot session middlewares, so it can't wait for one there)
+    """
+    files: Dict[str, InputFile] = {}
+    body: Dict[str, Any] = {"method": method.__api_method__}
+    for key, value in method.model_dump(warnings=False).items():
+        value = bot.session.prepare_value(value, bot=bot, files=files, _dumps_json=False)
+        if value is not None:
+            body[key] = value
+    if files:
+        return None
+    if limiter is not None and sends_message(method):
+        if not await limiter.try_acquire(getattr(method, "chat_id", None)):
+            return None
+    reply_stats.inline += 1
+    return body
+
+
+async def send_reply(bot: Bot, result: Any) -> None:
+    """
+    Send the method returned by a handler, when the update is not handled within a webhook request
+    """
+    if isinstance(result, TelegramMethod):
+        reply_stats.returned_outbound += 1
+        await Dispatcher.silent_call_request(bot=bot, result=result)
@@ -5,9 +5,13 @@ from aiogram.methods import DeleteWebhook
 
 from bot import dp, bot
 from content.handlers.routs import main_router
+from content.middlewares.dedup import Deduplicate
 from content.middlewares.middleware import register_middlewares
+from content.middlewares.schedule import Schedule
+from data.config import settings
 from logs import logging_config
 from management import app_start_with, app_stop_with
+from updates.scheduler import update_scheduler
 
 dictConfig(logging_config)
 
@@ -15,13 +19,24 @@ dictConfig(logging_config)
 async def start_bot():
     # register handlers and start/stop functions
     register_middlewares(dp)
+    if settings.UPDATE_SHARDS:
+        # before any middleware of ours awaits, so updates are scheduled in the order they arrived
+        dp.update.outer_middleware.register(Schedule())
+    if settings.UPDATE_DEDUP:
+        dp.update.outer_middleware.register(Deduplicate())
     dp.include_router(main_router)
 
+    if settings.UPDATE_SHARDS:
+        dp.startup.register(update_scheduler.start)
+        # scheduled updates are handled before app_stop_with closes the database and the bot session
+        dp.shutdown.register(update_scheduler.stop)
     dp.startup.register(app_start_with)
     dp.shutdown.register(app_stop_with)
 
     await bot(DeleteWebhook(drop_pending_updates=True))
-    await dp.start_polling(bot)
+    # with the scheduler updates are fed one by one (they only wait to be scheduled), which keeps
+    # the arrival order, and a full scheduler holds back polling instead of piling up tasks
+    await dp.start_polling(bot, handle_as_tasks=not settings.UPDATE_SHARDS)
 
 
 if __name__ == "__main__":
@@ -1,13 +1,67 @@
-from typing import TypeVar, Type, Generic, Sequence, Any, Optional, Union, Dict
-
-from sqlalchemy import insert, select, update, delete
+import logging
+import time
+from typing import (
+    TypeVar, Type, Generic, Sequence, Any, Optional, Union, Dict, Callable, Tuple, AsyncIterator, Iterator, List
+)
+
+from sqlalchemy import (
+    insert, select, update, delete, bindparam, inspect, tuple_, text, Table, Column, MetaData, any_, func,
+    literal_column, Boolean
+)
+from sqlalchemy.dialects.postgresql import ARRAY, insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached, QueryableAttribute
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, ClauseElement, ColumnClause
+
+from repository.crud.cache import PENDING_INVALIDATIONS, RedisRowCache, get_row_cache
+from repository.crud.bulk import BulkResult, Rows, iter_chunks
+from repository.crud.group_commit import group_committer
+from repository.crud.pagination import Page, encode_token, decode_token
+from repository.crud.statements import statement_cache
+from repository.routing import PRIMARY, has_written, use_primary
 
 T = TypeVar("T")
 
+# A column (an attribute or its name) to get scalars, or a sequence of columns to get rows
+Columns = Union[Any, Sequence[Any], None]
+
+logger = logging.getLogger(__name__)
+
+# asyncpg (and the postgres protocol) can't send more bind parameters in one statement
+MAX_BIND_PARAMS = 32767
+
+# ORM "evaluate" synchronization ignores values passed at execution time, so cached DML relies on RETURNING instead
+_CACHED_DML_OPTIONS = {"synchronize_session": "fetch"}
+
+
+def chunk_rows(
+        rows: Sequence[Any], params_per_row: int, params_limit: int = MAX_BIND_PARAMS
+) -> Iterator[Sequence[Any]]:
+    """
+    Split rows into chunks, so that a statement built from one chunk stays under the bind parameters limit
+    """
+    chunk_size = max(1, params_limit // max(1, params_per_row))
+    for start in range(0, len(rows), chunk_size):
+        yield rows[start:start + chunk_size]
+
 
 class BaseCRUDRepository(Generic[T]):
     model: Type[T] = None
+    # Columns of the unique constraint used by `upsert*` and `get_or_create`. None means the primary key
+    conflict_target: Optional[Sequence[str]] = None
+    # Cache primary key lookups of the model in Redis for `cache_ttl` seconds. None disables the cache
+    cache_ttl: Optional[int] = None
+    # Also keep cached rows in the worker memory for `local_cache_ttl` seconds (requires `cache_ttl`).
+    # Other workers evict changed rows through Redis pub/sub, the TTL bounds staleness if a message is lost
+    local_cache_ttl: Optional[float] = None
+    # Set to False if `_stmt_*` overrides depend on the filter values themselves, not only on their shape
+    cache_statements: bool = True
+    # Commit `create`, `update` and `delete` (with commit=True) together with concurrent writes of other handlers
+    # in one transaction (see `GroupCommitter`). Only writes of a session that has neither written in its current
+    # transaction nor has pending changes are grouped (reads before them are fine), others are committed inline
+    # with the rest of the session's changes
+    group_commit: bool = False
 
     def __init__(self, async_session: AsyncSession):
         super().__init__()
@@ -25,6 +79,243 @@ class BaseCRUDRepository(Generic[T]):
     async def close_session(self):
         await self.async_session.close()
 
+    @property
+    def row_cache(self) -> Optional[RedisRowCache]:
+        if self.cache_ttl is None:
+            return None
+        return get_row_cache(self.model, self.cache_ttl, self.local_cache_ttl)
+
+    def _cached_lookup_pk(self, filters: Sequence, filter_by: Dict[str, Any]) -> Any:
+        """
+        Return the primary key value if the lookup can be served by the row cache, otherwise None
+        """
+        if self.cache_ttl is None or filters or len(filter_by) != 1 or not self._cache_usable():
+            return None
+        return filter_by.get(self._primary_key_attr().key)
+
+    def _cache_usable(self) -> bool:
+        session = self.async_session
+        # after an uncommitted write the session must see its own changes, and a row it read may be rolled back
+        return not (session.info.get(PENDING_INVALIDATIONS) or session.new or session.dirty or session.deleted)
+
+    async def _get_cached(self, pk: Any) -> Optional[T]:
+        identity = inspect(self.model).identity_key_from_primary_key((pk,))
+        loaded = self.async_session.sync_session.identity_map.get(identity)
+        if loaded is not None:
+            # merging the cached row would overwrite the instance the session already has;
+            # an expired one is loaded by the query instead
+            return None if inspect(loaded).expired_attributes else loaded
+
+        values = await self.row_cache.get(pk)
+        if values is None:
+            return None
+        instance = self.model(**values)
+        # the row is attached to the session as if it was loaded by a query, without hitting the database
+        make_transient_to_detached(instance)
+        return await self.async_session.merge(instance, load=False)
+
+    async def _cache_refresh(self, instances: Sequence[T], commit: bool) -> None:
+        if self.cache_ttl is None:
+            return
+        if commit:
+            await self.row_cache.set_many(instances)
+        else:
+            await self._cache_invalidate([self.row_cache.pk_of(instance) for instance in instances], commit)
+
+    async def _cache_invalidate(self, pks: Sequence[Any], commit: bool) -> None:
+        if self.cache_ttl is None:
+            return
+        row_cache = self.row_cache
+        await row_cache.delete_many(pks)
+        if not commit:
+            # invalidated once more when the transaction ends, so a concurrent read can't put the old row back
+            # for the whole TTL
+            pending = self.async_session.info.setdefault(PENDING_INVALIDATIONS, {})
+            pending.setdefault(row_cache, set()).update(pks)
+
+    async def _cache_fill(self, instance: T) -> None:
+        if self._cache_usable():
+            await self.row_cache.set_many([instance], fill=True)
+
+    def _group_committable(self, commit: bool) -> bool:
+        session = self.async_session
+        # the batch would wait for row locks of the caller's transaction (a deadlock), and commit=True
+        # must commit the caller's changes as well; a transaction that has only read (sessions autobegin
+        # on the first query) holds no row locks and has nothing to commit, so it does not matter
+        return (
+                commit
+                and self.group_commit
+                and not has_written(session)
+                and not (session.new or session.dirty or session.deleted)
+        )
+
+    async def _group_committed(self, method: str, *args, attach: bool = True, **kwargs) -> Any:
+        repo_cls = type(self)
+        result = await group_committer.submit(
+            lambda session: getattr(repo_cls(session), method)(*args, commit=False, **kwargs)
+        )
+        # the caller reads its own write from the primary
+        use_primary(self.async_session)
+        if not attach:
+            return result
+        # the instance was loaded by the session of the batch, so it is attached to the caller's one
+        return await self.async_session.merge(result, load=False)
+
+    async def warm_up(self) -> None:
+        """
+        Run the primary key lookups of the repository once, so that the connection of the session has
+        their statements prepared (and SQLAlchemy has them compiled) before real updates arrive.
+        Only reads are executed and the row cache is bypassed.
+
+        Examples:
+            async with async_engine.connect() as connection:\n
+                await UserRepo(AsyncSession(bind=connection)).warm_up()
+        """
+        primary_key = self._primary_key_attrs()
+        if len(primary_key) != 1:
+            return
+        try:
+            # any value of the right type will do, the statement does not depend on it
+            lookup = {primary_key[0].key: primary_key[0].type.python_type()}
+        except (NotImplementedError, TypeError):
+            return
+
+        for hook in ("_stmt_get", "_stmt_filter"):
+            stmt, params = self._prepare_stmt(hook, (), lookup)
+            await self.async_session.execute(statement=stmt, params=params)
+        # count() is left out: it scans the whole table on every start
+        await self.exists(**lookup)
+
+    def _primary_key_attrs(self) -> list:
+        mapper = inspect(self.model)
+        return [getattr(self.model, mapper.get_property_by_column(column).key) for column in mapper.primary_key]
+
+    def _primary_key_attr(self):
+        primary_key = self._primary_key_attrs()
+        if len(primary_key) != 1:
+            raise ValueError(f"{self.model.__name__} has a composite primary key, pass filters explicitly")
+        return primary_key[0]
+
+    def _pk_any(self, ids: Optional[Sequence[Any]] = None, name: str = "pks"):
+        """
+        `pk = ANY(:pks)` condition: all ids are sent as a single array parameter
+        """
+        primary_key = self._primary_key_attr()
+        pks = bindparam(name, type_=ARRAY(primary_key.type))
+        if ids is not None:
+            pks = bindparam(name, list(ids), type_=ARRAY(primary_key.type))
+        return primary_key == any_(pks)
+
+    def _cached_stmt(self, hook: str, shape: Tuple, build: Callable[[], Any]):
+        return statement_cache.get_or_build((type(self), hook, shape), build)
+
+    @staticmethod
+    def _filters_shape(filters: Sequence) -> Optional[Tuple[Tuple, Dict[str, Any]]]:
+        """
+        Split `column <op> value` filters into a hashable shape and bind values.
+        None is returned if any filter is something else (sub queries, functions, IS NULL, ect),
+        such statements are built from scratch and left to the SQLAlchemy compiled cache.
+        """
+        shape, params = [], {}
+        for i, clause in enumerate(filters):
+            if not (
+                    isinstance(clause, BinaryExpression)
+                    and isinstance(clause.left, ColumnClause)
+                    and isinstance(clause.right, BindParameter)
+                    and not clause.modifiers
+            ):
+                return None
+            shape.append((getattr(clause.left, "table", None), clause.left.key, clause.operator, clause.right.expanding))
+            params[f"w{i}"] = clause.right.effective_value
+        return tuple(shape), params
+
+    @staticmethod
+    def _bind_filters(filters: Sequence) -> list:
+        bound = []
+        for i, clause in enumerate(filters):
+            placeholder = bindparam(f"w{i}", type_=clause.right.type, expanding=clause.right.expanding)
+            bound.append(visitors.replacement_traverse(
+                clause, {}, lambda element, value=clause.right, new=placeholder: new if element is value else None
+            ))
+        return bound
+
+    @staticmethod
+    def _kwargs_shape(prefix: str, kwargs: Dict[str, Any]) -> Optional[Tuple[Tuple, Dict[str, Any]]]:
+        if any(isinstance(value, ClauseElement) for value in kwargs.values()):
+            # SQL expressions as values (`counter=User.counter + 1`) are a part of the statement itself
+            return None
+        # None is kept in the statement itself: `filter_by(name=None)` must render IS NULL, not `= NULL`
+        shape = tuple((key, kwargs[key] is None) for key in sorted(kwargs))
+        params = {f"{prefix}_{key}": value for key, value in kwargs.items() if value is not None}
+        return shape, params
+
+    @staticmethod
+    def _bind_kwargs(prefix: str, shape: Tuple) -> Dict[str, Any]:
+        return {key: None if is_null else bindparam(f"{prefix}_{key}") for key, is_null in shape}
+
+    def _prepare_stmt(
+            self,
+            hook: str,
+            filters: Sequence = (),
+            filter_by: Optional[Dict[str, Any]] = None,
+            columns: Optional[Tuple] = None,
+    ) -> Tuple[Any, Optional[Dict[str, Any]]]:
+        """
+        Return the statement produced by the `hook` (`_stmt_get`, `_stmt_update`, ect) and its bind parameters.
+        For DML hooks `filter_by` holds the values to be written, `columns` narrows down selected columns.
+        """
+        build = getattr(self, hook)
+        filter_by = filter_by or {}
+        filters_shape = self._filters_shape(filters) if self.cache_statements else None
+        kwargs_shape = self._kwargs_shape("f", filter_by) if filters_shape is not None else None
+        columns_shape = self._columns_shape(columns)
+        if kwargs_shape is None or columns_shape is None:
+            return self._project(build(*filters, **filter_by), columns), None
+
+        shape, params = filters_shape
+        kwargs_shape, kwargs_params = kwargs_shape
+        params.update(kwargs_params)
+
+        stmt = self._cached_stmt(
+            hook,
+            (shape, kwargs_shape, columns_shape),
+            lambda: self._project(build(*self._bind_filters(filters), **self._bind_kwargs("f", kwargs_shape)), columns),
+        )
+        return stmt, params
+
+    def _prepare_all_stmt(self, columns: Optional[Tuple] = None):
+        columns_shape = self._columns_shape(columns)
+        if not self.cache_statements or columns_shape is None:
+            return self._project(self._stmt_all(), columns)
+        return self._cached_stmt("_stmt_all", columns_shape, lambda: self._project(self._stmt_all(), columns))
+
+    def _projection(self, columns: Columns) -> Tuple[Optional[Tuple], bool]:
+        """
+        Resolve the `columns` argument of read methods into columns to select and
+        whether the result is read with scalars() (ORM instances or values of a single column)
+        """
+        if columns is None:
+            return None, True
+        if isinstance(columns, (list, tuple)):
+            return tuple(self._column(column) for column in columns), False
+        return (self._column(columns),), True
+
+    def _column(self, column: Any):
+        return getattr(self.model, column) if isinstance(column, str) else column
+
+    @staticmethod
+    def _columns_shape(columns: Optional[Tuple]) -> Optional[Tuple]:
+        if columns is None:
+            return ()
+        if not all(isinstance(column, QueryableAttribute) for column in columns):
+            # expressions (functions, labels) have no stable identity to be a part of the cache key
+            return None
+        return tuple((column.class_, column.key) for column in columns)
+
+    @staticmethod
+    def _project(stmt, columns: Optional[Tuple]):
+        return stmt if columns is None else stmt.with_only_columns(*columns)
+
     def _stmt_insert(self, values: Union[Dict[str, Any], Sequence[Dict[str, Any]]]):
         """
         Override this method to change the logic, add filters, sorting, ect
@@ -37,6 +328,70 @@ class BaseCRUDRepository(Generic[T]):
             return insert_stmt.values(**values)
         return insert_stmt.values(values)
 
+    def _stmt_upsert(
+            self,
+            values: Union[Dict[str, Any], Sequence[Dict[str, Any]]],
+            conflict_target: Sequence[str],
+            update_columns: Sequence[str],
+    ):
+        """
+        Override this method to change the logic, add filters, sorting, ect
+        """
+        upsert_stmt = pg_insert(self.model)
+        if isinstance(values, dict):
+            upsert_stmt = upsert_stmt.values(**values)
+        else:
+            upsert_stmt = upsert_stmt.values(values)
+
+        if not update_columns:
+            return upsert_stmt.on_conflict_do_nothing(index_elements=conflict_target).returning(self.model)
+
+        set_ = {column: upsert_stmt.excluded[column] for column in update_columns}
+        # ON CONFLICT DO UPDATE skips python side `onupdate` values (updated_at, ect), so they are added explicitly
+        for column in self.model.__table__.columns:
+            if column.onupdate is not None and column.key not in set_ and not column.onupdate.is_callable:
+                set_[column.key] = column.onupdate.arg
+        return (
+            upsert_stmt
+            .on_conflict_do_update(index_elements=conflict_target, set_=set_)
+            .returning(self.model)
+        )
+
+    def _stmt_get_or_create(self, values: Dict[str, Any], conflict_target: Sequence[str]):
+        """
+        Override this method to change the logic, add filters, sorting, ect.
+        An existing row is "updated" with its own conflict target value, so RETURNING gives it as well;
+        `xmax = 0` holds only for a row inserted by the statement.
+        """
+        get_or_create_stmt = pg_insert(self.model).values(**values)
+        column = conflict_target[0]
+        return (
+            get_or_create_stmt
+            .on_conflict_do_update(index_elements=conflict_target, set_={column: get_or_create_stmt.excluded[column]})
+            .returning(self.model, literal_column("xmax = 0", Boolean).label("created"))
+        )
+
+    def _stmt_bulk_update(self, keys: Sequence[str], returning: bool):
+        """
+        Override this method to change the logic, add filters, sorting, ect.
+        Every key is bound as an array parameter `c_<key>`, rows are rebuilt on the server with unnest()
+        """
+        table = self.model.__table__
+        primary_key = self._primary_key_attr()
+        data = (
+            func.unnest(*(bindparam(f"c_{key}", type_=ARRAY(table.c[key].type)) for key in keys))
+            .table_valued(*keys, name="data")
+            .render_derived()
+        )
+        update_stmt = (
+            update(self.model)
+            .where(primary_key == data.c[primary_key.key])
+            .values({key: data.c[key] for key in keys if key != primary_key.key})
+        )
+        if returning:
+            return update_stmt.returning(self.model)
+        return update_stmt
+
     def _stmt_all(self):
         """
         Override this method to change the logic, add filters, sorting, ect
@@ -109,13 +464,24 @@ class BaseCRUDRepository(Generic[T]):
             ...\n
             await user_repo.commit_changes()
         """
-        insert_stmt = self._stmt_insert(kwargs)
-
-        query = await self.async_session.execute(insert_stmt)
+        if self._group_committable(commit):
+            return await self._group_committed("create", **kwargs)
+
+        values_shape = self._kwargs_shape("v", kwargs) if self.cache_statements else None
+        if values_shape is not None:
+            shape, params = values_shape
+            insert_stmt = self._cached_stmt(
+                "_stmt_insert", shape, lambda: self._stmt_insert(self._bind_kwargs("v", shape))
+            )
+        else:
+            insert_stmt, params = self._stmt_insert(kwargs), None
+
+        query = await self.async_session.execute(insert_stmt, params)
         created_user = query.scalar()
 
         if commit:
             await self.commit_changes()
+        await self._cache_refresh([created_user], commit)
 
         return created_user
 
@@ -143,16 +509,20 @@ class BaseCRUDRepository(Generic[T]):
             created_posts = await user_repo.create_many(rows, commit=False)\n
             ...\n
             await user_repo.commit_changes()
+
+        Note:
+            For large imports use `bulk_create()`, it loads rows with COPY and has no bind parameters limit.
         """
         insert_stmt = self._stmt_insert(rows)
 
         query = await self.async_session.execute(insert_stmt)
-        created_users = query.scalars()
+        created_users = query.scalars().all()
 
         if commit:
             await self.commit_changes()
+        await self._cache_refresh(created_users, commit)
 
-        return created_users.all()
+        return created_users
 
     async def create_obj(self, new_obj: T, commit: bool = True) -> T:
         """
@@ -219,10 +589,300 @@ class BaseCRUDRepository(Generic[T]):
 
         return await self.create_many(rows, commit)
 
-    async def all(self) -> Sequence[T]:
+    async def bulk_create(
+            self,
+            rows: Rows,
+            chunk_size: Optional[int] = 10_000,
+            returning: bool = True,
+            commit: bool = True,
+    ) -> BulkResult[T]:
+        """
+        Load rows into the model table with the binary COPY protocol of asyncpg, which is much faster than
+        `create_many` for large imports and has no bind parameters limit. Rows are loaded in the transaction
+        of the session, and optionally committed.
+
+        Args:
+            rows (Iterable[dict[str, Any]] | AsyncIterable[dict[str, Any]]): Dictionaries with the same keys
+                representing attribute values of the new objects. An async generator can be passed to keep
+                memory flat: only one chunk is held at a time.
+            chunk_size (int, optional): How many rows are sent in one COPY. None to send everything at once.
+                                        Defaults to 10 000.
+            returning (bool, optional): Whether to return the created instances. Rows are copied into
+                                        a temporary table and moved with `INSERT ... SELECT ... RETURNING` then.
+                                        Pass False for the fastest load straight into the table. Defaults to True.
+            commit (bool, optional): Whether to commit the changes to the database. Defaults to True.
+
+        Returns:
+            BulkResult[T]: The number of loaded rows, the load rate and the created instances (if `returning`).
+
+        Examples:
+            user_repo = UserRepo(async_session)\n
+            # Import users from another bot without keeping them in memory\n
+            async def read_users():\n
+                async for record in old_db.fetch_users():\n
+                    yield {'telegram_id': record.id, 'username': record.username}\n
+            result = await user_repo.bulk_create(read_users(), returning=False)\n
+            print(result.rows_per_second)
+        """
+        started = time.perf_counter()
+        connection = await self.async_session.connection()
+        raw_connection = await connection.get_raw_connection()
+        driver_connection = raw_connection.driver_connection
+        if not driver_connection.is_in_transaction():
+            # the asyncpg adapter begins a transaction lazily on the first statement, COPY must be a part of it
+            await connection.exec_driver_sql("SELECT 1")
+
+        table = self.model.__table__
+        columns, staging, loaded, created_objects = None, None, 0, []
+        async for chunk in iter_chunks(rows, chunk_size):
+            if columns is None:
+                columns = self._copy_columns(chunk[0])
+                if returning:
+                    staging = await self._create_staging_table(columns)
+            records = [self._copy_record(row, columns) for row in chunk]
+            names = [column.name for column in columns.values()]
+
+            if returning:
+                await driver_connection.copy_records_to_table(staging.name, records=records, columns=names)
+                move_stmt = (
+                    insert(self.model)
+                    .from_select(list(columns.values()), select(*staging.c))
+                    .returning(self.model)
+                )
+                query = await self.async_session.execute(move_stmt)
+                created_objects.extend(query.scalars().all())
+                await self.async_session.execute(text(f"TRUNCATE {staging.name}"))
+            else:
+                await driver_connection.copy_records_to_table(
+                    table.name, records=records, columns=names, schema_name=table.schema
+                )
+            loaded += len(records)
+
+        if commit:
+            await self.commit_changes()
+        await self._cache_refresh(created_objects, commit)
+
+        result = BulkResult(rows=loaded, seconds=time.perf_counter() - started, items=created_objects)
+        logger.info(
+            f"Bulk loaded {result.rows} rows into {table.name} in {result.seconds:.2f}s "
+            f"({result.rows_per_second:.0f} rows/s)"
+        )
+        return result
+
+    def _copy_columns(self, row: Dict[str, Any]) -> Dict[str, Column]:
+        """
+        Columns of the table to be copied, by attribute keys of the rows (COPY takes column names,
+        which may differ from the keys)
+        """
+        mapper = inspect(self.model)
+        columns = {key: mapper.attrs[key].columns[0] for key in row}
+        # COPY skips python side defaults, so columns that have them are always sent
+        for attr in mapper.column_attrs:
+            column = attr.columns[0]
+            if attr.key not in columns and column.default is not None and not column.default.is_clause_element:
+                columns[attr.key] = column
+        return columns
+
+    def _copy_record(self, row: Dict[str, Any], columns: Dict[str, Column]) -> tuple:
+        record = []
+        for key, column in columns.items():
+            if key in row:
+                record.append(row[key])
+            elif column.default.is_callable:
+                record.append(column.default.arg(None))
+            else:
+                record.append(column.default.arg)
+        return tuple(record)
+
+    async def _create_staging_table(self, columns: Dict[str, Column]) -> Table:
+        table = self.model.__table__
+        names = [column.name for column in columns.values()]
+        staging = Table(
+            f"_bulk_{table.name}", MetaData(), *(Column(column.name, column.type) for column in columns.values())
+        )
+        await self.async_session.execute(text(f"DROP TABLE IF EXISTS {staging.name}"))
+        await self.async_session.execute(text(
+            f"CREATE TEMPORARY TABLE {staging.name} ON COMMIT DROP "
+            f"AS SELECT {', '.join(names)} FROM {table.fullname} WITH NO DATA"
+        ))
+        return staging
+
+    def _conflict_target(self, conflict_target: Optional[Sequence[str]]) -> list[str]:
+        if conflict_target is not None:
+            return list(conflict_target)
+        if self.conflict_target is not None:
+            return list(self.conflict_target)
+        return [attr.key for attr in self._primary_key_attrs()]
+
+    async def upsert(
+            self,
+            commit: bool = True,
+            conflict_target: Optional[Sequence[str]] = None,
+            update_columns: Optional[Sequence[str]] = None,
+            **kwargs,
+    ) -> Optional[T]:
+        """
+        Insert a new instance of the model or update the existing one in a single
+        `INSERT ... ON CONFLICT ... DO UPDATE/DO NOTHING RETURNING` statement, and optionally commit the changes.
+
+        Args:
+            commit (bool, optional): Whether to commit the changes to the database. Defaults to True.
+            conflict_target (Sequence[str], optional): Columns of the unique constraint to check.
+                                                       Defaults to `conflict_target` of the repository
+                                                       or to the primary key.
+            update_columns (Sequence[str], optional): Columns to update if the row already exists.
+                                                      Defaults to all passed columns except the conflict target.
+                                                      Pass an empty sequence to leave the existing row as is
+                                                      (DO NOTHING), in this case None is returned for it.
+            **kwargs: Keyword arguments representing the values to be inserted.
+
+        Returns:
+            Optional[T]: The inserted or updated instance of the model.
+
+        Examples:
+            user_repo = UserRepo(async_session)\n
+            # Register a user or refresh their profile\n
+            user = await user_repo.upsert(telegram_id=1, username='alice', first_name='Alice')
+        """
+        conflict_target = self._conflict_target(conflict_target)
+        if update_columns is None:
+            update_columns = [key for key in kwargs if key not in conflict_target]
+
+        values_shape = self._kwargs_shape("v", kwargs) if self.cache_statements else None
+        if values_shape is not None:
+            shape, params = values_shape
+            upsert_stmt = self._cached_stmt(
+                "_stmt_upsert",
+                (shape, tuple(conflict_target), tuple(update_columns)),
+                lambda: self._stmt_upsert(self._bind_kwargs("v", shape), conflict_target, update_columns),
+            )
+        else:
+            upsert_stmt, params = self._stmt_upsert(kwargs, conflict_target, update_columns), None
+
+        query = await self.async_session.execute(upsert_stmt, params)
+        upserted_object = query.scalar()
+
+        if commit:
+            await self.commit_changes()
+        if upserted_object is not None:
+            await self._cache_refresh([upserted_object], commit)
+
+        return upserted_object
+
+    async def upsert_many(
+            self,
+            rows: Sequence[Dict[str, Any]],
+            commit: bool = True,
+            conflict_target: Optional[Sequence[str]] = None,
+            update_columns: Optional[Sequence[str]] = None,
+    ) -> Sequence[T]:
+        """
+        Insert or update multiple instances of the model with `INSERT ... ON CONFLICT` statements,
+        and optionally commit the changes. Rows are split into chunks to stay under the bind parameters limit,
+        all chunks are executed in one transaction.
+
+        Args:
+            rows (Sequence[dict[str, Any]]): A sequence of dictionaries with the same keys representing
+                                             attribute values of the objects. Rows must be unique
+                                             by the conflict target.
+            commit (bool, optional): Whether to commit the changes to the database. Defaults to True.
+            conflict_target (Sequence[str], optional): Columns of the unique constraint to check.
+                                                       Defaults to `conflict_target` of the repository
+                                                       or to the primary key.
+            update_columns (Sequence[str], optional): Columns to update if a row already exists.
+                                                      Defaults to all passed columns except the conflict target.
+                                                      Pass an empty sequence to skip existing rows (DO NOTHING).
+
+        Returns:
+            Sequence[T]: A sequence of inserted and updated instances of the model
+                         (with DO NOTHING only inserted ones are returned).
+
+        Examples:
+            user_repo = UserRepo(async_session)\n
+            # Import users, refreshing names of the known ones\n
+            rows = [{'telegram_id': 1, 'first_name': 'Alice'}, {'telegram_id': 2, 'first_name': 'Bob'}]\n
+            users = await user_repo.upsert_many(rows)
+        """
+        if not rows:
+            return []
+
+        conflict_target = self._conflict_target(conflict_target)
+        if update_columns is None:
+            update_columns = [key for key in rows[0] if key not in conflict_target]
+
+        upserted_objects = []
+        # python side defaults are sent as parameters too, so every column of the table is counted
+        for chunk in chunk_rows(rows, len(self.model.__table__.columns)):
+            upsert_stmt = self._stmt_upsert(chunk, conflict_target, update_columns)
+            query = await self.async_session.execute(upsert_stmt)
+            upserted_objects.extend(query.scalars().all())
+
+        if commit:
+            await self.commit_changes()
+        await self._cache_refresh(upserted_objects, commit)
+
+        return upserted_objects
+
+    async def get_or_create(
+            self,
+            defaults: Optional[Dict[str, Any]] = None,
+            commit: bool = True,
+            conflict_target: Optional[Sequence[str]] = None,
+            **lookup,
+    ) -> Tuple[T, bool]:
+        """
+        Create a new instance of the model, or get the existing one if the row already exists,
+        in a single round trip either way (`INSERT ... ON CONFLICT DO UPDATE ... RETURNING`).
+        Concurrent calls with the same lookup never fail with an IntegrityError.
+
+        Args:
+            defaults (dict[str, Any], optional): Values used only when a new instance is created.
+            commit (bool, optional): Whether to commit the changes to the database. Defaults to True.
+            conflict_target (Sequence[str], optional): Columns of the unique constraint to check.
+                                                       Defaults to `conflict_target` of the repository
+                                                       or to the primary key.
+            **lookup: Values of the unique columns identifying the instance, they are inserted as well.
+
+        Returns:
+            tuple[T, bool]: The instance of the model and whether it was created.
+
+        Examples:
+            user_repo = UserRepo(async_session)\n
+            # Register a user if they are new\n
+            user, created = await user_repo.get_or_create(telegram_id=1, defaults={'username': 'alice'})
+        """
+        conflict_target = self._conflict_target(conflict_target)
+        values = {**lookup, **(defaults or {})}
+
+        values_shape = self._kwargs_shape("v", values) if self.cache_statements else None
+        if values_shape is not None:
+            shape, params = values_shape
+            get_or_create_stmt = self._cached_stmt(
+                "_stmt_get_or_create",
+                (shape, tuple(conflict_target)),
+                lambda: self._stmt_get_or_create(self._bind_kwargs("v", shape), conflict_target),
+            )
+        else:
+            get_or_create_stmt, params = self._stmt_get_or_create(values, conflict_target), None
+
+        query = await self.async_session.execute(get_or_create_stmt, params)
+        instance, created = query.one()
+
+        if commit:
+            await self.commit_changes()
+        await self._cache_refresh([instance], commit)
+
+        return instance, created
+
+    async def all(self, columns: Columns = None) -> Sequence[T]:
         """
         Retrieve all instances of the model from the database.
 
+        Args:
+            columns (optional): Select only these columns (attributes or their names) and skip building
+                                ORM instances. A single column gives its values, a sequence of columns gives
+                                lightweight rows (named tuples). Defaults to None (ORM instances).
+
         Returns:
             Sequence[T]: A sequence of all instances of the model.
 
@@ -230,18 +890,25 @@ class BaseCRUDRepository(Generic[T]):
             user_repo = UserRepo(async_session)\n
             # Retrieve all users from the database\n
             all_users = await db_session.all(User)\n
+
+            # Retrieve only names of all users\n
+            names = await user_repo.all(columns=User.first_name)
         """
-        stmt = self._stmt_all()
+        columns, scalars = self._projection(columns)
+        stmt = self._prepare_all_stmt(columns)
         query = await self.async_session.execute(statement=stmt)
-        result = query.scalars()
+        result = query.scalars() if scalars else query
         return result.all()
 
-    async def filter(self, *filters, **filter_by) -> Sequence[T]:
+    async def filter(self, *filters, columns: Columns = None, **filter_by) -> Sequence[T]:
         """
         Retrieve instances of the model from the database that match the provided filters.
 
         Args:
             *filters: Additional filter conditions provided as SQLAlchemy expressions.
+            columns (optional): Select only these columns (attributes or their names) and skip building
+                                ORM instances. A single column gives its values, a sequence of columns gives
+                                lightweight rows (named tuples). Defaults to None (ORM instances).
             **filter_by: Filter conditions provided as keyword arguments.
                          These filter conditions are in the form of column_name=value.
 
@@ -256,19 +923,260 @@ class BaseCRUDRepository(Generic[T]):
 
             # Get users instance with name='Alice' and age > 30\n
             user = await db_session.filter(User.age > 30, name='Alice')
+
+            # Get (telegram_id, username) rows of active users\n
+            rows = await user_repo.filter(columns=[User.telegram_id, User.username], is_active=True)
         """
-        filter_stmt = self._stmt_filter(*filters, **filter_by)
-        query = await self.async_session.execute(statement=filter_stmt)
-        result = query.scalars()
+        columns, scalars = self._projection(columns)
+        filter_stmt, params = self._prepare_stmt("_stmt_filter", filters, filter_by, columns)
+        query = await self.async_session.execute(statement=filter_stmt, params=params)
+        result = query.scalars() if scalars else query
         return result.all()
 
-    async def get_or_none(self, *filters, **filter_by) -> Optional[T]:
+    def _aggregate_stmt(self, filters: Sequence, filter_by: Dict[str, Any], *columns) -> Tuple[Any, Optional[Dict]]:
+        filter_stmt, params = self._prepare_stmt("_stmt_filter", filters, filter_by)
+        # FROM of the model is kept even if there are no filters referring to it (SELECT count(*) FROM ...)
+        return filter_stmt.with_only_columns(*columns, maintain_column_froms=True).order_by(None), params
+
+    async def count(self, *filters, **filter_by) -> int:
+        """
+        Count instances of the model that match the provided filters, in the database.
+
+        Args:
+            *filters: Additional filter conditions provided as SQLAlchemy expressions.
+            **filter_by: Filter conditions provided as keyword arguments.
+                         These filter conditions are in the form of column_name=value.
+
+        Returns:
+            int: The number of matching instances.
+
+        Examples:
+            user_repo = UserRepo(async_session)\n
+            # Count active users\n
+            active_users = await user_repo.count(is_active=True)
+        """
+        count_stmt, params = self._aggregate_stmt(filters, filter_by, func.count())
+        query = await self.async_session.execute(statement=count_stmt, params=params)
+        return query.scalar_one()
+
+    async def exists(self, *filters, **filter_by) -> bool:
+        """
+        Check whether at least one instance of the model matches the provided filters.
+        The database stops at the first matching row (SELECT EXISTS (...)).
+
+        Args:
+            *filters: Additional filter conditions provided as SQLAlchemy expressions.
+            **filter_by: Filter conditions provided as keyword arguments.
+                         These filter conditions are in the form of column_name=value.
+
+        Returns:
+            bool: True if a matching instance exists.
+
+        Examples:
+            user_repo = UserRepo(async_session)\n
+            # Check whether a user is registered\n
+            registered = await user_repo.exists(telegram_id=1)
+        """
+        filter_stmt, params = self._prepare_stmt("_stmt_filter", filters, filter_by)
+        query = await self.async_session.execute(statement=select(filter_stmt.exists()), params=params)
+        return query.scalar_one()
+
+    async def aggregate(
+            self,
+            aggregates: Dict[str, Any],
+            *filters,
+            group_by: Columns = None,
+            **filter_by,
+    ) -> Union[Dict[str, Any], List[Any]]:
+        """
+        Calculate aggregates over instances of the model that match the provided filters, in the database.
+
+        Args:
+            aggregates (dict[str, Any]): Result names mapped to aggregates: either SQL expressions
+                                         (`func.max(User.created_at)`) or (function name, column name) pairs
+                                         (`('max', 'created_at')`), or a function name alone (`'count'`).
+            *filters: Additional filter conditions provided as SQLAlchemy expressions.
+            group_by (optional): A column or a sequence of columns (attributes or their names) to group by.
+                                 Defaults to None.
+            **filter_by: Filter conditions provided as keyword arguments.
+                         These filter conditions are in the form of column_name=value.
+
+        Returns:
+            dict[str, Any] | list[Row]: Aggregates by their names, or one row per group
+                                        (group columns followed by aggregates) if `group_by` is passed.
+
+        Examples:
+            user_repo = UserRepo(async_session)\n
+            # First and last registration dates\n
+            dates = await user_repo.aggregate({'first': ('min', 'created_at'), 'last': ('max', 'created_at')})\n
+
+            # Number of active and inactive users\n
+            rows = await user_repo.aggregate({'users': 'count'}, group_by=User.is_active)
+        """
+        labeled = [self._aggregate(expression).label(name) for name, expression in aggregates.items()]
+        group_columns, _ = self._projection(group_by)
+        group_columns = group_columns or ()
+
+        aggregate_stmt, params = self._aggregate_stmt(filters, filter_by, *group_columns, *labeled)
+        if group_columns:
+            aggregate_stmt = aggregate_stmt.group_by(*group_columns)
+
+        query = await self.async_session.execute(statement=aggregate_stmt, params=params)
+        if group_columns:
+            return query.all()
+        return dict(query.one()._mapping)
+
+    def _aggregate(self, expression: Any):
+        if isinstance(expression, str):
+            return getattr(func, expression)()
+        if isinstance(expression, (list, tuple)):
+            function, column = expression
+            return getattr(func, function)(self._column(column))
+        return expression
+
+    async def stream_all(self, batch_size: int = 1000, columns: Columns = None) -> AsyncIterator[T]:
+        """
+        Iterate over all instances of the model through a server-side cursor,
+        fetching `batch_size` rows at a time instead of loading the whole table into memory.
+
+        Args:
+            batch_size (int, optional): How many rows are fetched from the cursor at once. Defaults to 1000.
+            columns (optional): Select only these columns, see `all()`. Defaults to None (ORM instances).
+
+        Yields:
+            T: Instances of the model.
+
+        Examples:
+            user_repo = UserRepo(async_session)\n
+            # Export all users without loading them at once\n
+            async for user in user_repo.stream_all(batch_size=500):\n
+                writer.writerow([user.telegram_id, user.username])
+        """
+        columns, scalars = self._projection(columns)
+        async for instance in self._stream(self._prepare_all_stmt(columns), None, batch_size, scalars):
+            yield instance
+
+    async def stream_filter(
+            self, *filters, batch_size: int = 1000, columns: Columns = None, **filter_by
+    ) -> AsyncIterator[T]:
+        """
+        Iterate over instances of the model that match the provided filters through a server-side cursor,
+        fetching `batch_size` rows at a time.
+
+        Args:
+            *filters: Additional filter conditions provided as SQLAlchemy expressions.
+            batch_size (int, optional): How many rows are fetched from the cursor at once. Defaults to 1000.
+            columns (optional): Select only these columns, see `filter()`. Defaults to None (ORM instances).
+            **filter_by: Filter conditions provided as keyword arguments.
+                         These filter conditions are in the form of column_name=value.
+
+        Yields:
+            T: Instances of the model matching the provided filters.
+
+        Examples:
+            user_repo = UserRepo(async_session)\n
+            # Iterate over active users\n
+            async for user in user_repo.stream_filter(is_active=True):\n
+                ...
+        """
+        columns, scalars = self._projection(columns)
+        filter_stmt, params = self._prepare_stmt("_stmt_filter", filters, filter_by, columns)
+        async for instance in self._stream(filter_stmt, params, batch_size, scalars):
+            yield instance
+
+    async def _stream(
+            self, stmt, params: Optional[Dict[str, Any]], batch_size: int, scalars: bool
+    ) -> AsyncIterator[T]:
+        result = await self.async_session.stream(
+            statement=stmt, params=params, execution_options={"yield_per": batch_size}
+        )
+        try:
+            async for instance in (result.scalars() if scalars else result):
+                yield instance
+        finally:
+            await result.close()
+
+    async def paginate(
+            self,
+            *filters,
+            order_by: Any = None,
+            limit: int = 100,
+            token: Optional[str] = None,
+            descending: bool = False,
+            columns: Columns = None,
+            **filter_by,
+    ) -> Page[T]:
+        """
+        Retrieve one page of instances using keyset (seek) pagination, so every page costs the same
+        regardless of how deep it is. The primary key is always a part of the key, so `order_by`
+        may be any indexed column, unique or not.
+
+        Args:
+            *filters: Additional filter conditions provided as SQLAlchemy expressions.
+            order_by (optional): A column (attribute or its name) to paginate by. Defaults to the primary key.
+                                 The column must not contain NULL values.
+            limit (int, optional): Maximal number of instances on the page. Defaults to 100.
+            token (str, optional): The `next_token` of the previous page. None to get the first page.
+            descending (bool, optional): Whether to go from the greatest key to the least one. Defaults to False.
+            columns (optional): Select only these columns, see `filter()`. Rows also get the key columns
+                                appended to the end. Defaults to None (ORM instances).
+            **filter_by: Filter conditions provided as keyword arguments.
+                         These filter conditions are in the form of column_name=value.
+
+        Returns:
+            Page[T]: Instances of the page and a token of the next page (None if it's the last one).
+
+        Examples:
+            user_repo = UserRepo(async_session)\n
+            # Go through all active users by registration date\n
+            page = await user_repo.paginate(order_by=User.created_at, limit=50, is_active=True)\n
+            while page.next_token is not None:\n
+                page = await user_repo.paginate(order_by=User.created_at, limit=50, token=page.next_token, is_active=True)
+        """
+        key_columns = self._primary_key_attrs()
+        if order_by is not None:
+            order_column = getattr(self.model, order_by) if isinstance(order_by, str) else order_by
+            if order_column.key not in {column.key for column in key_columns}:
+                key_columns.insert(0, order_column)
+
+        columns, scalars = self._projection(columns)
+        if columns is not None:
+            columns = (*columns, *key_columns)
+        stmt, params = self._prepare_stmt("_stmt_filter", filters, filter_by, columns)
+        if token is not None:
+            key = tuple_(*key_columns)
+            last = tuple_(*decode_token(token, key_columns))
+            stmt = stmt.where(key < last if descending else key > last)
+        # the keyset order must be the only one, whatever order `_stmt_filter` applies
+        stmt = (
+            stmt
+            .order_by(None)
+            .order_by(*(column.desc() if descending else column.asc() for column in key_columns))
+            .limit(limit + 1)
+        )
+
+        query = await self.async_session.execute(statement=stmt, params=params)
+        rows = query.scalars().all() if columns is None else query.all()
+        has_next = len(rows) > limit
+        rows = rows[:limit]
+
+        next_token = None
+        if has_next and columns is None:
+            next_token = encode_token([getattr(rows[-1], column.key) for column in key_columns])
+        elif has_next:
+            next_token = encode_token(rows[-1][-len(key_columns):])
+
+        items = [row[0] for row in rows] if columns is not None and scalars else rows
+        return Page(items=items, next_token=next_token)
+
+    async def get_or_none(self, *filters, columns: Columns = None, **filter_by) -> Optional[T]:
         """
         Retrieve a single instance of the model that matches the provided filters,
         or return None if no such instance exists.
 
         Args:
             *filters: Additional filter conditions provided as SQLAlchemy expressions.
+            columns (optional): Select only these columns, see `filter()`. Defaults to None (ORM instance).
             **filter_by: Filter conditions provided as keyword arguments.
                          These filter conditions are in the form of column_name=value.
 
@@ -284,18 +1192,31 @@ class BaseCRUDRepository(Generic[T]):
             # Get a user instance with name='Alice' and age > 30\n
             user = await db_session.get_or_none(User.age > 30, name='Alice')
         """
-        get_stmt = self._stmt_get(*filters, **filter_by)
-        query = await self.async_session.execute(statement=get_stmt)
-        result = query.scalars().one_or_none()
+        columns, scalars = self._projection(columns)
+        cached_pk = self._cached_lookup_pk(filters, filter_by) if columns is None else None
+        if cached_pk is not None:
+            cached = await self._get_cached(cached_pk)
+            if cached is not None:
+                return cached
+
+        get_stmt, params = self._prepare_stmt("_stmt_get", filters, filter_by, columns)
+        # the row is cached, so it is read from the primary: a lagging replica would put a stale one in the cache
+        bind_arguments = PRIMARY if cached_pk is not None else None
+        query = await self.async_session.execute(statement=get_stmt, params=params, bind_arguments=bind_arguments)
+        result = (query.scalars() if scalars else query).one_or_none()
+
+        if cached_pk is not None and result is not None:
+            await self._cache_fill(result)
         return result
 
-    async def get(self, *filters, **filter_by) -> T:
+    async def get(self, *filters, columns: Columns = None, **filter_by) -> T:
         """
         Retrieve a single instance of the model that matches the provided filters,
         or raise an EntityDoesNotExistError if no such instance exists.
 
         Args:
             *filters: Additional filter conditions provided as SQLAlchemy expressions.
+            columns (optional): Select only these columns, see `filter()`. Defaults to None (ORM instance).
             **filter_by: Filter conditions provided as keyword arguments.
                          These filter conditions are in the form of column_name=value.
 
@@ -311,9 +1232,21 @@ class BaseCRUDRepository(Generic[T]):
             # Get a user instance with name='Alice' and age > 30\n
             user = await db_session.get(User.age > 30, name='Alice')
         """
-        get_stmt = self._stmt_get(*filters, **filter_by)
-        query = await self.async_session.execute(statement=get_stmt)
-        result = query.scalars().one()
+        columns, scalars = self._projection(columns)
+        cached_pk = self._cached_lookup_pk(filters, filter_by) if columns is None else None
+        if cached_pk is not None:
+            cached = await self._get_cached(cached_pk)
+            if cached is not None:
+                return cached
+
+        get_stmt, params = self._prepare_stmt("_stmt_get", filters, filter_by, columns)
+        # the row is cached, so it is read from the primary: a lagging replica would put a stale one in the cache
+        bind_arguments = PRIMARY if cached_pk is not None else None
+        query = await self.async_session.execute(statement=get_stmt, params=params, bind_arguments=bind_arguments)
+        result = (query.scalars() if scalars else query).one()
+
+        if cached_pk is not None:
+            await self._cache_fill(result)
         return result
 
     async def update(self, *filters, commit: bool = True, **kwargs) -> T:
@@ -339,12 +1272,18 @@ class BaseCRUDRepository(Generic[T]):
             `commit_changes()` method. However, if you are updating multiple objects with the same changes,
             it is recommended to use the `update_many()` method to reduce the number of SQL queries.
         """
-        update_stmt = self._stmt_update(*filters, **kwargs)
-        query = await self.async_session.execute(statement=update_stmt)
+        if self._group_committable(commit):
+            return await self._group_committed("update", *filters, **kwargs)
+
+        update_stmt, params = self._prepare_stmt("_stmt_update", filters, kwargs)
+        query = await self.async_session.execute(
+            statement=update_stmt, params=params, execution_options=_CACHED_DML_OPTIONS if params else None
+        )
         updated_object = query.scalars().one()
 
         if commit:
             await self.commit_changes()
+        await self._cache_refresh([updated_object], commit)
 
         return updated_object
 
@@ -371,14 +1310,17 @@ class BaseCRUDRepository(Generic[T]):
             `commit_changes()` method. However, if you are updating multiple objects with the same changes,
             it is recommended to use the `update_many()` method to reduce the number of SQL queries.
         """
-        update_stmt = self._stmt_update(*filters, **kwargs)
-        query = await self.async_session.execute(statement=update_stmt)
-        updated_objects = query.scalars()
+        update_stmt, params = self._prepare_stmt("_stmt_update", filters, kwargs)
+        query = await self.async_session.execute(
+            statement=update_stmt, params=params, execution_options=_CACHED_DML_OPTIONS if params else None
+        )
+        updated_objects = query.scalars().all()
 
         if commit:
             await self.commit_changes()
+        await self._cache_refresh(updated_objects, commit)
 
-        return updated_objects.all()
+        return updated_objects
 
     async def update_by_id(self, id: int, commit: bool = True, **kwargs) -> T:
         """
@@ -397,7 +1339,128 @@ class BaseCRUDRepository(Generic[T]):
             # Update user with id=1 to set their age to 30 and role to 'admin'\n
             updated_user = await user_repo.update_by_id(1, age=30, role='admin')
         """
-        return await self.update(self.model.id == id, commit=commit, **kwargs)
+        return await self.update(self._primary_key_attr() == id, commit=commit, **kwargs)
+
+    async def update_by_pks(
+            self,
+            ids: Sequence[Any],
+            chunk_size: int = 10_000,
+            returning: bool = False,
+            commit: bool = True,
+            **kwargs,
+    ) -> BulkResult[T]:
+        """
+        Update instances of the model with the given primary keys with the same values.
+        The primary key column is detected from the mapper, ids of a chunk are sent as a single
+        array parameter (`pk = ANY(:pks)`), so there is no limit on the number of ids.
+
+        Args:
+            ids (Sequence[Any]): Primary keys of the instances to update.
+            chunk_size (int, optional): How many rows are updated by one statement. Defaults to 10 000.
+            returning (bool, optional): Whether to return the updated instances. Defaults to False.
+            commit (bool, optional): Whether to commit every chunk in its own transaction, which keeps locks
+                                     short on large inputs. If False, the changes are left in the session
+                                     transaction. Defaults to True.
+            **kwargs: Values to be updated for the instances.
+
+        Returns:
+            BulkResult[T]: The number of updated rows and the updated instances (if `returning`).
+
+        Examples:
+            user_repo = UserRepo(async_session)\n
+            # Deactivate users who blocked the bot\n
+            result = await user_repo.update_by_pks(blocked_ids, is_active=False)
+        """
+        if returning:
+            update_stmt = self._stmt_update(self._pk_any(), **kwargs)
+        else:
+            update_stmt = update(self.model).where(self._pk_any()).values(**kwargs)
+        return await self._execute_by_pks(update_stmt, ids, chunk_size, returning, commit)
+
+    async def update_many_by_pk(
+            self,
+            rows: Sequence[Dict[str, Any]],
+            chunk_size: int = 10_000,
+            returning: bool = False,
+            commit: bool = True,
+    ) -> BulkResult[T]:
+        """
+        Update multiple instances of the model, each with its own values, in one `UPDATE ... FROM unnest(...)`
+        statement per chunk. Each column is sent as a single array parameter, so a chunk costs one round trip
+        regardless of its size, and there is no bind parameters limit. The changes are committed once at the end.
+
+        Args:
+            rows (Sequence[dict[str, Any]]): Dictionaries with the primary key and the values to set.
+                                             Rows with different sets of keys are updated by separate statements.
+            chunk_size (int, optional): How many rows are updated by one statement. Defaults to 10 000.
+            returning (bool, optional): Whether to return the updated instances. Defaults to False.
+            commit (bool, optional): Whether to commit the changes to the database. Defaults to True.
+
+        Returns:
+            BulkResult[T]: The number of updated rows and the updated instances (if `returning`).
+
+        Examples:
+            user_repo = UserRepo(async_session)\n
+            # Sync changed names of users\n
+            rows = [{'telegram_id': 1, 'username': 'alice'}, {'telegram_id': 2, 'username': 'bob'}]\n
+            result = await user_repo.update_many_by_pk(rows)
+        """
+        started = time.perf_counter()
+        primary_key = self._primary_key_attr()
+        groups: Dict[Tuple[str, ...], list] = {}
+        for row in rows:
+            if primary_key.key not in row:
+                raise ValueError(f"Row {row!r} has no primary key {primary_key.key!r}")
+            groups.setdefault(tuple(row), []).append(row)
+
+        execution_options = _CACHED_DML_OPTIONS if returning else {"synchronize_session": False}
+        affected, objects = 0, []
+        for keys, group in groups.items():
+            update_stmt = self._cached_stmt(
+                "_stmt_bulk_update", (keys, returning), lambda: self._stmt_bulk_update(keys, returning)
+            )
+            for start in range(0, len(group), chunk_size):
+                chunk = group[start:start + chunk_size]
+                params = {f"c_{key}": [row[key] for row in chunk] for key in keys}
+                query = await self.async_session.execute(
+                    statement=update_stmt, params=params, execution_options=execution_options
+                )
+                if returning:
+                    chunk_objects = query.scalars().all()
+                    objects.extend(chunk_objects)
+                    affected += len(chunk_objects)
+                else:
+                    affected += query.rowcount
+
+        if commit:
+            await self.commit_changes()
+        await self._cache_invalidate([row[primary_key.key] for row in rows], commit)
+
+        return BulkResult(rows=affected, seconds=time.perf_counter() - started, items=objects)
+
+    async def _execute_by_pks(
+            self, stmt, ids: Sequence[Any], chunk_size: int, returning: bool, commit: bool
+    ) -> BulkResult[T]:
+        started = time.perf_counter()
+        affected, objects = 0, []
+        execution_options = _CACHED_DML_OPTIONS if returning else {"synchronize_session": False}
+        for start in range(0, len(ids), chunk_size):
+            chunk = list(ids[start:start + chunk_size])
+            query = await self.async_session.execute(
+                statement=stmt, params={"pks": chunk}, execution_options=execution_options
+            )
+            if returning:
+                chunk_objects = query.scalars().all()
+                objects.extend(chunk_objects)
+                affected += len(chunk_objects)
+            else:
+                affected += query.rowcount
+
+            if commit:
+                await self.commit_changes()
+            await self._cache_invalidate(chunk, commit)
+
+        return BulkResult(rows=affected, seconds=time.perf_counter() - started, items=objects)
 
     async def delete(self, *filters, commit: bool = True) -> T:
         """
@@ -415,12 +1478,19 @@ class BaseCRUDRepository(Generic[T]):
             # Delete a single user with id=1\n
             deleted_user = await user_repo.delete(User.id == 1)
         """
-        delete_stmt = self._stmt_delete(*filters)
-        query = await self.async_session.execute(statement=delete_stmt)
+        if self._group_committable(commit):
+            return await self._group_committed("delete", *filters, attach=False)
+
+        delete_stmt, params = self._prepare_stmt("_stmt_delete", filters)
+        query = await self.async_session.execute(
+            statement=delete_stmt, params=params, execution_options=_CACHED_DML_OPTIONS if params else None
+        )
         deleted_object = query.scalars().one()
 
         if commit:
             await self.commit_changes()
+        if self.cache_ttl is not None:
+            await self._cache_invalidate([self.row_cache.pk_of(deleted_object)], commit)
 
         return deleted_object
 
@@ -440,14 +1510,18 @@ class BaseCRUDRepository(Generic[T]):
             # Delete all users with age less than 30\n
             deleted_users = await user_repo.delete_many(User.age < 30)
         """
-        delete_stmt = self._stmt_delete(*filters)
-        query = await self.async_session.execute(statement=delete_stmt)
-        deleted_objects = query.scalars()
+        delete_stmt, params = self._prepare_stmt("_stmt_delete", filters)
+        query = await self.async_session.execute(
+            statement=delete_stmt, params=params, execution_options=_CACHED_DML_OPTIONS if params else None
+        )
+        deleted_objects = query.scalars().all()
 
         if commit:
             await self.commit_changes()
+        if self.cache_ttl is not None:
+            await self._cache_invalidate([self.row_cache.pk_of(instance) for instance in deleted_objects], commit)
 
-        return deleted_objects.all()
+        return deleted_objects
 
     async def delete_by_id(self, id: int, commit: bool = True) -> T:
         """
@@ -465,7 +1539,7 @@ class BaseCRUDRepository(Generic[T]):
             # Delete a user with id=1\n
             deleted_user = await user_repo.delete_by_id(1)
         """
-        return await self.delete(self.model.id == id, commit=commit)
+        return await self.delete(self._primary_key_attr() == id, commit=commit)
 
     async def delete_obj(self, deleted_obj: T, commit: bool = True) -> T:
         """
@@ -484,12 +1558,13 @@ class BaseCRUDRepository(Generic[T]):
             user = await user_repo.get(id=1)\n
             deleted_user = await user_repo.delete_obj(user)
         """
-        return await self.delete(self.model.id == deleted_obj.id, commit=commit)
+        primary_key = self._primary_key_attr()
+        return await self.delete(primary_key == getattr(deleted_obj, primary_key.key), commit=commit)
 
     async def delete_many_obj(self, deleted_objs: Sequence[T], commit: bool = True) -> Sequence[T]:
         """
         Delete multiple instances of the model from the database.
-        The id field is used as a filter for deletion
+        The primary key is used as a filter for deletion
 
         Args:
             deleted_objs (Sequence[T]): A sequence of instances of the model to delete.
@@ -504,5 +1579,41 @@ class BaseCRUDRepository(Generic[T]):
             users = await user_repo.filter(User.age < 20)\n
             deleted_users = await db_session.delete_many_obj(users)
         """
-        id_to_delete = [deleted_obj.id for deleted_obj in deleted_objs]
-        return await self.delete_many(self.model.id.in_(id_to_delete), commit=commit)
+        primary_key = self._primary_key_attr()
+        id_to_delete = [getattr(deleted_obj, primary_key.key) for deleted_obj in deleted_objs]
+        return await self.delete_many(self._pk_any(id_to_delete), commit=commit)
+
+    async def delete_by_pks(
+            self,
+            ids: Sequence[Any],
+            chunk_size: int = 10_000,
+            returning: bool = False,
+            commit: bool = True,
+    ) -> BulkResult[T]:
+        """
+        Delete instances of the model with the given primary keys.
+        The primary key column is detected from the mapper, ids of a chunk are sent as a single
+        array parameter (`pk = ANY(:pks)`), so there is no limit on the number of ids.
+
+        Args:
+            ids (Sequence[Any]): Primary keys of the instances to delete.
+            chunk_size (int, optional): How many rows are deleted by one statement. Defaults to 10 000.
+            returning (bool, optional): Whether to return the deleted instances. Defaults to False.
+            commit (bool, optional): Whether to commit every chunk in its own transaction, which keeps locks
+                                     short on large inputs. If False, the changes are left in the session
+                                     transaction. Defaults to True.
+
+        Returns:
+            BulkResult[T]: The number of deleted rows and the deleted instances (if `returning`).
+
+        Examples:
+            user_repo = UserRepo(async_session)\n
+            # Clean up deactivated users\n
+            result = await user_repo.delete_by_pks(deactivated_ids)\n
+            print(result.rows)
+        """
+        if returning:
+            delete_stmt = self._stmt_delete(self._pk_any())
+        else:
+            delete_stmt = delete(self.model).where(self._pk_any())
+        return await self._execute_by_pks(delete_stmt, ids, chunk_size, returning, commit)
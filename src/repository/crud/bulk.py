@@ -0,0 +1,43 @@
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterable, AsyncIterator, Generic, Iterable, List, Optional, Sequence, TypeVar, Union
+
+T = TypeVar("T")
+
+Rows = Union[Iterable[Any], AsyncIterable[Any]]
+
+
+@dataclass(frozen=True)
+class BulkResult(Generic[T]):
+    """
+    Outcome of a bulk operation: the number of processed rows, time spent and
+    the returned instances (empty if the operation was run without RETURNING)
+    """
+    rows: int
+    seconds: float
+    items: Sequence[T] = field(default_factory=list)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else float(self.rows)
+
+
+async def iter_chunks(rows: Rows, chunk_size: Optional[int]) -> AsyncIterator[List[Any]]:
+    """
+    Group rows from a regular or an async iterable into lists of `chunk_size` rows (None - everything in one list)
+    """
+    chunk = []
+    if isinstance(rows, AsyncIterable):
+        async for row in rows:
+            chunk.append(row)
+            if chunk_size is not None and len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    else:
+        for row in rows:
+            chunk.append(row)
+            if chunk_size is not None and len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+
+    if chunk:
+        yield chunk
@@ -0,0 +1,324 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple, Type
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import inspect
+
+from data.config import settings
+from repository.crud.pagination import cast_value
+from repository.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+# session.info key of row cache entries to be invalidated once more when the transaction ends
+PENDING_INVALIDATIONS = "crud_cache_pending_invalidations"
+
+
+class RowCacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.local_hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.writes = 0
+        self.invalidations = 0
+        self.latency_seconds = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        lookups = self.hits + self.local_hits + self.misses
+        return {
+            "hits": self.hits,
+            "local_hits": self.local_hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "writes": self.writes,
+            "invalidations": self.invalidations,
+            "hit_ratio": (self.hits + self.local_hits) / lookups if lookups else 0.0,
+            "avg_latency_ms": self.latency_seconds / lookups * 1000 if lookups else 0.0,
+        }
+
+
+class LocalRowCache:
+    """
+    Bounded in-process LRU cache of serialized rows with a TTL, capped both by the number of entries and
+    by the payload size. Entries are evicted by other workers through `RowCacheInvalidator`.
+    """
+
+    def __init__(
+            self,
+            ttl: float,
+            max_entries: int = settings.ROW_CACHE_LOCAL_MAX_ENTRIES,
+            max_bytes: int = settings.ROW_CACHE_LOCAL_MAX_BYTES,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries: OrderedDict[str, Tuple[float, str]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, raw = entry
+        if expires_at < time.monotonic():
+            self.evict([key])
+            return None
+        self._entries.move_to_end(key)
+        return raw
+
+    def set(self, key: str, raw: str) -> None:
+        self.evict([key])
+        self._entries[key] = (time.monotonic() + self.ttl, raw)
+        self.size_bytes += len(raw)
+        while self._entries and (len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes):
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.size_bytes -= len(evicted)
+
+    def evict(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size_bytes -= len(entry[1])
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size_bytes = 0
+
+
+class RowCacheInvalidator:
+    """
+    Keeps local row caches of all workers coherent: every write publishes the changed keys to a Redis
+    channel, and a listener task of each worker evicts them from its local caches.
+    Messages lost while the listener reconnects are covered by clearing the local caches.
+    """
+
+    def __init__(self, redis: Redis = redis_client, channel: str = settings.ROW_CACHE_INVALIDATION_CHANNEL):
+        self.redis = redis
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+        self.local_caches: Dict[str, LocalRowCache] = {}
+        self.received = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def publish(self, prefix: str, keys: Iterable[str]) -> None:
+        message = json.dumps({"origin": self.origin, "prefix": prefix, "keys": list(keys)}, separators=(",", ":"))
+        await self.redis.publish(self.channel, message)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+            self._task.add_done_callback(self._on_listener_exit)
+
+    def _on_listener_exit(self, task: asyncio.Task) -> None:
+        if task is not self._task or task.cancelled():
+            return
+        # without the listener local caches of this worker serve rows changed by other workers
+        logger.error("Row cache invalidation listener exited, restarting it", exc_info=task.exception())
+        self._task = None
+        self.start()
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self.redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    # anything published before the subscription may have been missed
+                    for local_cache in self.local_caches.values():
+                        local_cache.clear()
+                    async for message in pubsub.listen():
+                        try:
+                            self._on_message(message["data"])
+                        except Exception as e:
+                            # one bad message must not stop the eviction of the others
+                            logger.error(f"Row cache invalidation message {message!r} is skipped: {e}")
+            except RedisError as e:
+                logger.warning(f"Row cache invalidation listener lost connection: {e}")
+                await asyncio.sleep(1)
+            except Exception as e:
+                logger.exception(f"Row cache invalidation listener failed, resubscribing: {e}")
+                await asyncio.sleep(1)
+
+    def _on_message(self, data: bytes) -> None:
+        message = json.loads(data)
+        if message["origin"] == self.origin:
+            return
+        local_cache = self.local_caches.get(message["prefix"])
+        if local_cache is not None:
+            self.received += 1
+            local_cache.evict(message["keys"])
+
+
+invalidator: RowCacheInvalidator = RowCacheInvalidator()
+
+
+class RedisRowCache:
+    """
+    Read-through cache of rows of one model in Redis, keyed by the primary key.
+    A row is stored as a JSON list of column values (in the mapper order, without names) with a TTL.
+    If `local_ttl` is set, rows are also kept in a bounded in-process cache, so hot reads skip Redis too.
+    Redis failures are logged and treated as misses, so the cache never breaks a lookup.
+    """
+
+    def __init__(
+            self,
+            model: Type[Any],
+            ttl: int,
+            local_ttl: Optional[float] = None,
+            redis: Redis = redis_client,
+            prefix: str = "crud",
+    ):
+        self.model = model
+        self.ttl = ttl
+        self.redis = redis
+        self.prefix = f"{prefix}:{model.__table__.name}"
+        self.stats = RowCacheStats()
+        self.local: Optional[LocalRowCache] = None
+        if local_ttl is not None:
+            self.local = invalidator.local_caches[self.prefix] = LocalRowCache(local_ttl)
+
+        mapper = inspect(model)
+        self._attrs = [(attr.key, attr.columns[0]) for attr in mapper.column_attrs]
+        self._pk_key = mapper.get_property_by_column(mapper.primary_key[0]).key
+
+    def key(self, pk: Any) -> str:
+        return f"{self.prefix}:{pk}"
+
+    def pk_of(self, instance: Any) -> Any:
+        # the identity survives expiration, the attribute does not
+        state = inspect(instance)
+        return state.identity[0] if state.identity else state.dict.get(self._pk_key)
+
+    def dumps(self, instance: Any) -> Optional[str]:
+        # the state dict is used instead of getattr, so expired attributes never trigger a lazy load
+        state = inspect(instance).dict
+        if any(key not in state for key, _ in self._attrs):
+            return None
+        return json.dumps([state[key] for key, _ in self._attrs], default=str, separators=(",", ":"))
+
+    def loads(self, raw: bytes) -> Dict[str, Any]:
+        return {key: cast_value(value, column) for (key, column), value in zip(self._attrs, json.loads(raw))}
+
+    async def get(self, pk: Any) -> Optional[Dict[str, Any]]:
+        key = self.key(pk)
+        if self.local is not None:
+            raw = self.local.get(key)
+            if raw is not None:
+                self.stats.local_hits += 1
+                return self.loads(raw)
+
+        started = time.perf_counter()
+        try:
+            raw = await self.redis.get(key)
+        except RedisError as e:
+            self.stats.errors += 1
+            logger.warning(f"Row cache lookup of {self.key(pk)} failed: {e}")
+            return None
+        finally:
+            self.stats.latency_seconds += time.perf_counter() - started
+
+        if raw is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        if self.local is not None:
+            self.local.set(key, raw.decode())
+        return self.loads(raw)
+
+    async def set_many(self, instances: Iterable[Any], fill: bool = False) -> None:
+        """
+        Cache the rows written by a transaction: they replace cached ones and are evicted from local caches
+        of other workers. With `fill=True` the rows are just read from the database (on a cache miss),
+        they are cached only if there is no entry yet (SET NX): a fill read before a concurrent write
+        must not replace the row written by it.
+        """
+        values, unserializable = {}, []
+        for instance in instances:
+            raw = self.dumps(instance)
+            if raw is not None:
+                values[self.key(self.pk_of(instance))] = raw
+            else:
+                unserializable.append(self.pk_of(instance))
+        if unserializable and not fill:
+            # expired instances (a commit with expire_on_commit) can't be cached, the old rows must go anyway
+            await self.delete_many(unserializable)
+        if not values:
+            return
+
+        if self.local is not None and not fill:
+            for key, raw in values.items():
+                self.local.set(key, raw)
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, raw in values.items():
+                    pipe.set(key, raw, ex=self.ttl, nx=fill)
+                written = await pipe.execute()
+            if self.local is not None and fill:
+                for (key, raw), is_written in zip(values.items(), written):
+                    if is_written:
+                        self.local.set(key, raw)
+            if self.local is not None and not fill:
+                await invalidator.publish(self.prefix, values)
+        except RedisError as e:
+            self.stats.errors += 1
+            logger.warning(f"Row cache write to {self.prefix} failed: {e}")
+            return
+        self.stats.writes += sum(1 for is_written in written if is_written)
+
+    async def delete_many(self, pks: Iterable[Any]) -> None:
+        keys = [self.key(pk) for pk in pks]
+        if not keys:
+            return
+
+        if self.local is not None:
+            self.local.evict(keys)
+        try:
+            await self.redis.delete(*keys)
+            if self.local is not None:
+                await invalidator.publish(self.prefix, keys)
+        except RedisError as e:
+            self.stats.errors += 1
+            logger.warning(f"Row cache invalidation in {self.prefix} failed: {e}")
+            return
+        self.stats.invalidations += len(keys)
+
+
+row_caches: Dict[Type[Any], RedisRowCache] = {}
+
+
+def get_row_cache(model: Type[Any], ttl: int, local_ttl: Optional[float] = None) -> RedisRowCache:
+    row_cache = row_caches.get(model)
+    if row_cache is None:
+        row_cache = row_caches[model] = RedisRowCache(model, ttl, local_ttl)
+    return row_cache
+
+
+async def flush_pending_invalidations(session: Any) -> None:
+    """
+    Invalidate the rows written in the just finished transaction of the session once more: after a commit
+    a read that raced with the transaction can't keep the old row in the cache for the whole TTL,
+    after a rollback an uncommitted row that got into the cache is dropped.
+    Called by the session events (see `repository/events.py`).
+    """
+    pending = session.info.pop(PENDING_INVALIDATIONS, None) or {}
+    for row_cache, pks in pending.items():
+        await row_cache.delete_many(pks)
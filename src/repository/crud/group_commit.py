@@ -0,0 +1,116 @@
+import asyncio
+import contextvars
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from data.config import settings
+from repository.database import async_db
+
+R = TypeVar("R")
+
+Operation = Callable[[AsyncSession], Awaitable[Any]]
+
+logger = logging.getLogger(__name__)
+
+
+class GroupCommitter:
+    """
+    Gathers small writes of concurrent handlers, which arrive within `window` seconds (or until `max_batch`
+    of them are collected), and runs them in one transaction on one connection, so a spike of one-row writes
+    costs one commit instead of one per write. Every operation runs in its own savepoint, so a failed
+    operation raises only in its caller, the others are still committed. If the commit itself fails,
+    every caller of the batch gets the error.
+    """
+
+    def __init__(
+            self,
+            window: float = settings.GROUP_COMMIT_WINDOW,
+            max_batch: int = settings.GROUP_COMMIT_MAX_BATCH,
+            session_factory: async_sessionmaker = async_db.async_session,
+    ):
+        self.window = window
+        self.max_batch = max_batch
+        self.session_factory = session_factory
+        self.batches = 0
+        self.operations = 0
+        self.failed_operations = 0
+        self.failed_commits = 0
+        self._pending: List[Tuple[Operation, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: Set[asyncio.Task] = set()
+
+    async def submit(self, operation: Callable[[AsyncSession], Awaitable[R]]) -> R:
+        """
+        Run `operation` with the session of the next batch (it must not commit) and return its result
+        once the batch is committed
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((operation, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    async def drain(self) -> None:
+        self._flush()
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            # the batch runs in an empty context, so its statements are not counted in the update of a caller
+            contextvars.Context().run(self._start, batch)
+
+    def _start(self, batch: List[Tuple[Operation, asyncio.Future]]) -> None:
+        task = asyncio.create_task(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[Tuple[Operation, asyncio.Future]]) -> None:
+        self.batches += 1
+        self.operations += len(batch)
+        results = []
+        try:
+            async with self.session_factory() as session:
+                for operation, future in batch:
+                    try:
+                        async with session.begin_nested():
+                            results.append((future, await operation(session), None))
+                    except Exception as e:
+                        self.failed_operations += 1
+                        results.append((future, None, e))
+                await session.commit()
+        except Exception as e:
+            self.failed_commits += 1
+            logger.error(f"Group commit of {len(batch)} operations failed: {e}")
+            results = [(future, None, e) for _, future in batch]
+
+        for future, result, error in results:
+            if future.done():
+                # the caller was cancelled
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "operations": self.operations,
+            "failed_operations": self.failed_operations,
+            "failed_commits": self.failed_commits,
+            "avg_batch_size": self.operations / self.batches if self.batches else 0.0,
+            "pending": len(self._pending),
+        }
+
+
+group_committer: GroupCommitter = GroupCommitter()
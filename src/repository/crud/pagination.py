@@ -0,0 +1,49 @@
+import base64
+import datetime
+import json
+from dataclasses import dataclass
+from typing import Any, Generic, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class Page(Generic[T]):
+    """
+    One page of a keyset (seek) pagination. Pass `next_token` to the next call to continue,
+    None means that there are no more rows.
+    """
+    items: Sequence[T]
+    next_token: Optional[str] = None
+
+
+def encode_token(values: Sequence[Any]) -> str:
+    raw = json.dumps(list(values), default=str, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_token(token: str, columns: Sequence[Any]) -> list[Any]:
+    """
+    Restore the key values stored in the token, casting them back to python types of the key columns
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except ValueError as e:
+        raise ValueError(f"Invalid pagination token: {token!r}") from e
+    if not isinstance(values, list) or len(values) != len(columns):
+        raise ValueError(f"Pagination token {token!r} does not match the key columns")
+
+    return [cast_value(value, column) for value, column in zip(values, columns)]
+
+
+def cast_value(value: Any, column: Any) -> Any:
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+
+    if value is None or isinstance(value, python_type):
+        return value
+    if python_type in (datetime.datetime, datetime.date, datetime.time):
+        return python_type.fromisoformat(value)
+    return python_type(value)
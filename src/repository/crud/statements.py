@@ -0,0 +1,45 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+
+class StatementCache:
+    """
+    Keeps SQLAlchemy constructs produced by the repositories' `_stmt_*` hooks.
+    Keys are made of the repository class, the hook name and the filter shape (column names and operators,
+    never values), so a statement is built once and later calls only bind parameters.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._statements: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        try:
+            statement = self._statements[key]
+        except KeyError:
+            self.misses += 1
+            statement = self._statements[key] = build()
+            if len(self._statements) > self.maxsize:
+                self._statements.popitem(last=False)
+            return statement
+
+        self.hits += 1
+        self._statements.move_to_end(key)
+        return statement
+
+    def clear(self) -> None:
+        self._statements.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._statements),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+statement_cache: StatementCache = StatementCache()
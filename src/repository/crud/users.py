@@ -4,4 +4,7 @@ from repository.models.user import User
 
 class UserRepo(BaseCRUDRepository[User]):
     model = User
+    # the sender is looked up on almost every update
+    cache_ttl = 5 * 60
+    local_cache_ttl = 30
 
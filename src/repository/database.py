@@ -1,33 +1,119 @@
+import time
+from typing import Any, Dict
+
 import pydantic
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
     create_async_engine,
     async_sessionmaker,
 )
-from sqlalchemy.pool import Pool
+from sqlalchemy.pool import Pool, AsyncAdaptedQueuePool
 from yarl import URL
 
 from data.config import settings
+from repository.routing import ReplicaSet, RoutingSession
+
+
+class PoolStats:
+    """
+    Counters of the connection pool of this worker process, fed by the pool events (see `repository/events.py`)
+    """
+
+    def __init__(self):
+        self.connects = 0
+        self.closes = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.in_use = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def observe_wait(self, seconds: float) -> None:
+        self.waits += 1
+        self.wait_seconds += seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def as_dict(self, pool: Pool) -> Dict[str, Any]:
+        return {
+            "size": pool.size(),
+            "in_use": self.in_use,
+            "idle": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "open": self.connects - self.closes,
+            "connects": self.connects,
+            "closes": self.closes,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "avg_wait_ms": self.wait_seconds / self.waits * 1000 if self.waits else 0.0,
+            "max_wait_ms": self.max_wait_seconds * 1000,
+        }
+
+
+pool_stats: PoolStats = PoolStats()
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """ Measures how long a checkout waits for a connection, there is no pool event for that """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_stats.observe_wait(time.perf_counter() - started)
 
 
 class AsyncDatabase:
     def __init__(self):
         self.__postgres_dsn: pydantic.PostgresDsn = settings.postgres_dsn
-        self.async_engine: AsyncEngine = create_async_engine(
-            url=self.async_postgres_dsn,
+        self.async_engine: AsyncEngine = self._create_engine(self.async_postgres_dsn, poolclass=InstrumentedAsyncPool)
+        self.replicas = ReplicaSet(
+            engines=[self._create_engine(self._async_dsn(dsn)) for dsn in settings.postgres_replica_dsns],
+            strategy=settings.POSTGRES_REPLICA_STRATEGY,
+            health_check_interval=settings.POSTGRES_REPLICA_HEALTH_CHECK_INTERVAL,
+            health_check_timeout=settings.POSTGRES_REPLICA_HEALTH_CHECK_TIMEOUT,
+        )
+        self.async_session = async_sessionmaker(
+            self.async_engine,
+            expire_on_commit=False,
+            sync_session_class=RoutingSession,
+            replicas=self.replicas,
         )
-        self.async_session = async_sessionmaker(self.async_engine, expire_on_commit=False)
         self.pool: Pool = self.async_engine.pool
 
+    @staticmethod
+    def _create_engine(url: str, **kwargs) -> AsyncEngine:
+        pool_size, max_overflow = settings.postgres_pool_sizing
+        return create_async_engine(
+            url=url,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=settings.POSTGRES_POOL_TIMEOUT,
+            pool_recycle=settings.POSTGRES_POOL_RECYCLE,
+            pool_pre_ping=settings.POSTGRES_POOL_PRE_PING,
+            connect_args={"prepared_statement_cache_size": settings.POSTGRES_STATEMENT_CACHE_SIZE},
+            **kwargs,
+        )
+
+    @staticmethod
+    def _async_dsn(dsn: pydantic.PostgresDsn) -> str:
+        return str(URL(dsn.unicode_string()).with_scheme("postgresql+asyncpg"))
+
     @property
     def async_postgres_dsn(self) -> str:
-        url = URL(self.__postgres_dsn.unicode_string())
-        async_url = url.with_scheme("postgresql+asyncpg")
-        return str(async_url)
+        return self._async_dsn(self.__postgres_dsn)
 
     @property
     def sync_postgres_dsn(self) -> str:
         return self.__postgres_dsn.unicode_string()
 
+    def pool_status(self) -> Dict[str, Any]:
+        return pool_stats.as_dict(self.pool)
+
+    async def dispose(self) -> None:
+        await self.async_engine.dispose()
+        await self.replicas.dispose()
+
 
 async_db: AsyncDatabase = AsyncDatabase()
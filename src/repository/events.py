@@ -1,10 +1,16 @@
 import logging
+from typing import Optional
 
 from sqlalchemy import event
 from sqlalchemy.dialects.postgresql.asyncpg import AsyncAdapt_asyncpg_connection
-from sqlalchemy.pool import _ConnectionRecord
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import _ConnectionRecord, PoolProxiedConnection
+from sqlalchemy.util.concurrency import await_only, in_greenlet
 
-from repository.database import async_db
+from repository.crud.cache import PENDING_INVALIDATIONS, flush_pending_invalidations
+from repository.database import async_db, pool_stats
+from repository.query_stats import query_stats
+from repository.routing import RoutingSession
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +19,7 @@ logger = logging.getLogger(__name__)
 def inspect_db_server_on_connection(
         db_api_connection: AsyncAdapt_asyncpg_connection, connection_record: _ConnectionRecord
 ) -> None:
+    pool_stats.connects += 1
     logger.info("--- New DB Connection ---")
 
 
@@ -20,4 +27,41 @@ def inspect_db_server_on_connection(
 def inspect_db_server_on_close(
         db_api_connection: AsyncAdapt_asyncpg_connection, connection_record: _ConnectionRecord
 ) -> None:
+    pool_stats.closes += 1
     logger.info(f"--- Closing DB Connection ---")
+
+
+@event.listens_for(target=async_db.async_engine.sync_engine, identifier="checkout")
+def inspect_db_server_on_checkout(
+        db_api_connection: AsyncAdapt_asyncpg_connection,
+        connection_record: _ConnectionRecord,
+        connection_proxy: PoolProxiedConnection,
+) -> None:
+    pool_stats.checkouts += 1
+    pool_stats.in_use += 1
+
+
+@event.listens_for(target=async_db.async_engine.sync_engine, identifier="checkin")
+def inspect_db_server_on_checkin(
+        db_api_connection: Optional[AsyncAdapt_asyncpg_connection], connection_record: _ConnectionRecord
+) -> None:
+    pool_stats.checkins += 1
+    pool_stats.in_use -= 1
+
+
+@event.listens_for(target=RoutingSession, identifier="after_commit")
+@event.listens_for(target=RoutingSession, identifier="after_rollback")
+def flush_row_cache_invalidations(session: Session) -> None:
+    # whoever ends the transaction (a repository, a handler, the session middleware), the rows written in it
+    # are invalidated once more; AsyncSession runs the sync session in a greenlet, so the event can await Redis
+    if not session.info.get(PENDING_INVALIDATIONS):
+        return
+    if not in_greenlet():
+        logger.warning("Row cache invalidations of a sync session are dropped")
+        session.info.pop(PENDING_INVALIDATIONS, None)
+        return
+    await_only(flush_pending_invalidations(session))
+
+
+for engine in (async_db.async_engine, *async_db.replicas.engines):
+    query_stats.instrument(engine.sync_engine)
@@ -0,0 +1,230 @@
+import bisect
+import contextlib
+import functools
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from data.config import settings
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the latency histogram buckets, ms (the last bucket is unbounded)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+_QUERY_STARTED = "query_stats_started"
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PARAMETER = re.compile(r"\$\d+|%\(\w+\)s|%s|(?<![:\w]):[A-Za-z_]\w*|\?")
+# asyncpg parameters come with casts: `IN ($1::BIGINT, $2::BIGINT)`, `$1::VARCHAR(255)` (the length is a literal too)
+_CAST = r"(?:::[A-Za-z_][\w ]*(?:\([?\s,]*\))?(?:\[\])*)?"
+_PARAMETER_LIST = re.compile(rf"\(\s*\?{_CAST}(?:\s*,\s*\?{_CAST})+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(statement: str) -> str:
+    """
+    Normalize SQL, so that statements differing only in literals, parameters, lengths of IN lists
+    and whitespace get the same fingerprint
+    """
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _PARAMETER.sub("?", normalized)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _PARAMETER_LIST.sub("(...)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+def redact(parameters: Any) -> Any:
+    """
+    Keep only the shape of parameters (types instead of values), so they are safe to log
+    """
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, list):
+        return f"<{len(parameters)} parameter sets>"
+    if isinstance(parameters, tuple):
+        return tuple(type(value).__name__ for value in parameters)
+    return type(parameters).__name__
+
+
+class QueryFingerprintStats:
+    __slots__ = ("calls", "seconds", "max_seconds", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def observe(self, seconds: float) -> None:
+        self.calls += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+
+    def percentile_ms(self, percentile: float) -> float:
+        """
+        Upper bound of the bucket the percentile falls into (the max latency for the last bucket)
+        """
+        rank, seen = percentile * self.calls, 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return float(bound)
+        return self.max_seconds * 1000
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "total_ms": self.seconds * 1000,
+            "avg_ms": self.seconds / self.calls * 1000 if self.calls else 0.0,
+            "max_ms": self.max_seconds * 1000,
+            "p50_ms": self.percentile_ms(0.5),
+            "p95_ms": self.percentile_ms(0.95),
+            "p99_ms": self.percentile_ms(0.99),
+            "histogram": dict(zip([*map(str, LATENCY_BUCKETS_MS), "inf"], self.buckets)),
+        }
+
+
+class QueryRecorder:
+    """
+    Statements executed within one unit of work (an update, a test), grouped by fingerprint
+    """
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.fingerprints: Counter[str] = Counter()
+
+    def observe(self, key: str, seconds: float) -> None:
+        self.statements += 1
+        self.seconds += seconds
+        self.fingerprints[key] += 1
+
+    def repeated(self, max_repeats: int) -> List[tuple[str, int]]:
+        """
+        Fingerprints executed more than `max_repeats` times, the usual sign of an N+1 loop
+        """
+        return [(key, count) for key, count in self.fingerprints.most_common() if count > max_repeats]
+
+
+# The recorder of the current update (task), statements are counted into it in addition to the global stats
+current_recorder: ContextVar[Optional[QueryRecorder]] = ContextVar("query_recorder", default=None)
+
+
+class QueryStats:
+    """
+    Call counts and latency histograms per statement fingerprint, fed by the cursor execution events
+    of the engines. Statements slower than `slow_query_ms` are logged with redacted parameters.
+    """
+
+    def __init__(self, slow_query_ms: float = settings.SLOW_QUERY_MS, max_fingerprints: int = 1000):
+        self.slow_query_ms = slow_query_ms
+        self.max_fingerprints = max_fingerprints
+        self.slow_queries = 0
+        self.fingerprints: Dict[str, QueryFingerprintStats] = {}
+
+    def instrument(self, engine: Engine) -> None:
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        event.listen(engine, "handle_error", self._handle_error)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault(_QUERY_STARTED, []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        seconds = time.perf_counter() - conn.info[_QUERY_STARTED].pop()
+        key = self.observe(statement, parameters, seconds)
+        recorder = current_recorder.get()
+        if recorder is not None:
+            recorder.observe(key, seconds)
+
+    def _handle_error(self, exception_context) -> None:
+        # a failed statement never reaches after_cursor_execute
+        connection = exception_context.connection
+        if connection is not None and connection.info.get(_QUERY_STARTED):
+            connection.info[_QUERY_STARTED].pop()
+
+    def observe(self, statement: str, parameters: Any, seconds: float) -> str:
+        key = fingerprint(statement)
+        stats = self.fingerprints.get(key)
+        if stats is None:
+            # statements built from arbitrary SQL must not grow the table without limit
+            table_key = key if len(self.fingerprints) < self.max_fingerprints else "<other>"
+            stats = self.fingerprints.setdefault(table_key, QueryFingerprintStats())
+        stats.observe(seconds)
+
+        if seconds * 1000 >= self.slow_query_ms:
+            self.slow_queries += 1
+            logger.warning(f"Slow query ({seconds * 1000:.1f} ms): {key} parameters: {redact(parameters)}")
+        return key
+
+    def top(self, limit: Optional[int] = 20, order_by: str = "total_ms") -> List[Dict[str, Any]]:
+        rows = [{"fingerprint": key, **stats.as_dict()} for key, stats in self.fingerprints.items()]
+        rows.sort(key=lambda row: row[order_by], reverse=True)
+        return rows[:limit]
+
+    def reset(self) -> None:
+        self.fingerprints.clear()
+        self.slow_queries = 0
+
+
+query_stats: QueryStats = QueryStats()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def check_query_budget(
+        recorder: QueryRecorder,
+        max_statements: Optional[int] = None,
+        max_ms: Optional[float] = None,
+        max_repeats: Optional[int] = None,
+) -> List[str]:
+    """
+    Return descriptions of the broken limits (empty if the recorded statements fit into the budget)
+    """
+    problems = []
+    if max_statements is not None and recorder.statements > max_statements:
+        problems.append(f"{recorder.statements} statements (budget {max_statements})")
+    if max_ms is not None and recorder.seconds * 1000 > max_ms:
+        problems.append(f"{recorder.seconds * 1000:.1f} ms in the database (budget {max_ms:.0f} ms)")
+    if max_repeats is not None:
+        for key, count in recorder.repeated(max_repeats):
+            problems.append(f"possible N+1, executed {count} times: {key}")
+    return problems
+
+
+@contextlib.contextmanager
+def assert_queries(
+        max_statements: Optional[int] = None,
+        max_ms: Optional[float] = None,
+        max_repeats: Optional[int] = None,
+) -> Iterator[QueryRecorder]:
+    """
+    Record statements executed inside the block and raise `QueryBudgetExceeded` if they do not fit
+    into the budget. Meant for tests.
+
+    Examples:
+        with assert_queries(max_statements=3, max_repeats=1):\n
+            await cmd_start(message, state, session)
+    """
+    recorder = QueryRecorder()
+    token = current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        current_recorder.reset(token)
+
+    problems = check_query_budget(recorder, max_statements, max_ms, max_repeats)
+    if problems:
+        raise QueryBudgetExceeded("; ".join(problems))
@@ -0,0 +1,179 @@
+import asyncio
+import itertools
+import logging
+from typing import Any, Dict, Optional, Sequence
+
+from sqlalchemy import Select, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session, SessionTransactionOrigin
+
+logger = logging.getLogger(__name__)
+
+# session.info keys
+_STICKY_PRIMARY = "routing_sticky_primary"
+_REPLICA = "routing_replica"
+_WRITTEN = "routing_written"
+
+# bind arguments of a read that must not lag behind the primary (a row cache fill, ect)
+PRIMARY = {"primary_only": True}
+
+
+def _name(engine: AsyncEngine) -> str:
+    return f"{engine.url.host}:{engine.url.port}"
+
+
+class ReplicaSet:
+    """
+    Read replicas of the primary database. A background task checks them with `SELECT 1`,
+    reads are spread only between replicas that passed the last check.
+    """
+
+    def __init__(
+            self,
+            engines: Sequence[AsyncEngine],
+            strategy: str = "round_robin",
+            health_check_interval: float = 5.0,
+            health_check_timeout: float = 2.0,
+    ):
+        self.engines = list(engines)
+        self.strategy = strategy
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.healthy: Dict[AsyncEngine, bool] = {engine: True for engine in self.engines}
+        self.reads: Dict[str, int] = {_name(engine): 0 for engine in self.engines}
+        self.fallbacks = 0
+        self._round_robin = itertools.cycle(self.engines)
+        self._task: Optional[asyncio.Task] = None
+
+    def __bool__(self) -> bool:
+        return bool(self.engines)
+
+    def pick(self) -> Optional[Engine]:
+        """
+        Return the sync engine of a healthy replica to read from, or None if all of them are down
+        """
+        healthy = [engine for engine in self.engines if self.healthy[engine]]
+        if not healthy:
+            self.fallbacks += 1
+            return None
+
+        if self.strategy == "least_connections":
+            engine = min(healthy, key=lambda e: e.pool.checkedout())
+        else:
+            engine = next(self._round_robin)
+            while not self.healthy[engine]:
+                engine = next(self._round_robin)
+        self.reads[_name(engine)] += 1
+        return engine.sync_engine
+
+    def is_healthy(self, sync_engine: Engine) -> bool:
+        return any(self.healthy[engine] for engine in self.engines if engine.sync_engine is sync_engine)
+
+    def start(self) -> None:
+        if self.engines and self._task is None:
+            self._task = asyncio.create_task(self._check_health())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def dispose(self) -> None:
+        for engine in self.engines:
+            await engine.dispose()
+
+    async def _check_health(self) -> None:
+        while True:
+            for engine in self.engines:
+                healthy = await self._ping(engine)
+                if healthy != self.healthy[engine]:
+                    logger.warning(f"Read replica {_name(engine)} is {'back' if healthy else 'down'}")
+                self.healthy[engine] = healthy
+            await asyncio.sleep(self.health_check_interval)
+
+    async def _ping(self, engine: AsyncEngine) -> bool:
+        async def ping():
+            async with engine.connect() as connection:
+                await connection.execute(text("SELECT 1"))
+
+        try:
+            await asyncio.wait_for(ping(), timeout=self.health_check_timeout)
+        except Exception as e:
+            logger.debug(f"Health check of read replica {_name(engine)} failed: {e}")
+            return False
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "replicas": {
+                _name(engine): {
+                    "healthy": self.healthy[engine],
+                    "reads": self.reads[_name(engine)],
+                    "in_use": engine.pool.checkedout(),
+                }
+                for engine in self.engines
+            },
+            "fallbacks_to_primary": self.fallbacks,
+        }
+
+
+class RoutingSession(Session):
+    """
+    Session that sends plain SELECTs to a read replica and everything else to the primary.
+    Flushes, DML, SELECT ... FOR UPDATE and explicitly begun transactions always use the primary.
+    After the first write the session sticks to the primary, so it reads its own writes
+    (the middleware opens one session per update). A single read is sent to the primary
+    with `session.execute(stmt, bind_arguments=PRIMARY)`.
+    """
+
+    def __init__(self, *args, replicas: Optional[ReplicaSet] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.replicas = replicas
+
+    def get_bind(self, mapper=None, *, clause=None, primary_only: bool = False, **kwargs):
+        primary = super().get_bind(mapper, clause=clause, **kwargs)
+        writes = self._flushing or not isinstance(clause, Select) or clause._for_update_arg is not None
+        if writes:
+            self.info[_WRITTEN] = True
+        if not self.replicas or primary_only or self.info.get(_STICKY_PRIMARY):
+            return primary
+
+        if writes:
+            self.info[_STICKY_PRIMARY] = True
+            return primary
+        if self._transaction is not None and self._transaction.origin is not SessionTransactionOrigin.AUTOBEGIN:
+            return primary
+
+        # one replica per session, so a session does not hold connections to all of them
+        replica = self.info.get(_REPLICA)
+        if replica is None or not self.replicas.is_healthy(replica):
+            replica = self.info[_REPLICA] = self.replicas.pick()
+        return replica or primary
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _reset_written(session: Session, transaction: Any) -> None:
+    if transaction.parent is None:
+        session.info.pop(_WRITTEN, None)
+
+
+def has_written(session: Any) -> bool:
+    """
+    Whether the current transaction of the session has written (or locked) rows,
+    so it holds row locks until it ends. Plain reads do not count.
+    """
+    return bool(session.info.get(_WRITTEN))
+
+
+def use_primary(session: Any) -> None:
+    """
+    Send all further reads of the session to the primary, for example when the data
+    written by another process must be seen without the replication lag
+    """
+    session.info[_STICKY_PRIMARY] = True
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+import time
+from typing import List, Type
+
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from data.config import settings
+from repository.crud.base import BaseCRUDRepository
+from repository.database import async_db
+
+logger = logging.getLogger(__name__)
+
+
+def registered_repositories() -> List[Type[BaseCRUDRepository]]:
+    """
+    Repository classes (subclasses of `BaseCRUDRepository` with a model) imported so far
+    """
+    repositories, stack = [], list(BaseCRUDRepository.__subclasses__())
+    while stack:
+        repo_cls = stack.pop()
+        stack.extend(repo_cls.__subclasses__())
+        if repo_cls.model is not None:
+            repositories.append(repo_cls)
+    return repositories
+
+
+async def _warm_up_connection(connection: AsyncConnection, repositories: List[Type[BaseCRUDRepository]]) -> None:
+    async with AsyncSession(bind=connection) as session:
+        for repo_cls in repositories:
+            await repo_cls(session).warm_up()
+        await session.rollback()
+
+
+async def warm_up_engine(engine: AsyncEngine, size: int) -> int:
+    """
+    Open `size` connections at once (so the pool keeps all of them) and prepare the hot statements
+    of the registered repositories on each of them. Returns the number of connections warmed up.
+    """
+    size = min(size, engine.pool.size())
+    if size <= 0:
+        return 0
+    repositories = registered_repositories()
+    connections = await asyncio.gather(*(engine.connect() for _ in range(size)))
+    try:
+        await asyncio.gather(*(_warm_up_connection(connection, repositories) for connection in connections))
+    finally:
+        for connection in connections:
+            await connection.close()
+    return size
+
+
+async def warm_up_database(size: int = settings.POSTGRES_POOL_WARMUP_SIZE) -> None:
+    started = time.perf_counter()
+    connections = await warm_up_engine(async_db.async_engine, size)
+    for replica in async_db.replicas.engines:
+        try:
+            connections += await warm_up_engine(replica, size)
+        except Exception as e:
+            # the health check excludes the replica until it is reachable
+            logger.warning(f"Warm-up of read replica {replica.url.host} failed: {e}")
+    logger.info(
+        f"Database warm-up: {connections} connections, {len(registered_repositories())} repositories "
+        f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+    )
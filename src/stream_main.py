@@ -0,0 +1,42 @@
+import asyncio
+import signal
+from logging.config import dictConfig
+
+from bot import dp
+from content.handlers.routs import main_router
+from content.middlewares.dedup import Deduplicate
+from content.middlewares.middleware import register_middlewares
+from data.config import settings
+from logs import logging_config
+from management import app_start_with, app_stop_with
+from updates.scheduler import update_scheduler
+from updates.stream import UpdateStreamConsumer
+
+dictConfig(logging_config)
+
+
+async def start_worker():
+    # register handlers, the updates are read from the stream the webhook appends to (UPDATE_STREAM=true)
+    register_middlewares(dp)
+    if settings.UPDATE_DEDUP:
+        dp.update.outer_middleware.register(Deduplicate())
+    dp.include_router(main_router)
+
+    consumer = UpdateStreamConsumer(scheduler=update_scheduler if settings.UPDATE_SHARDS else None)
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, consumer.stop)
+
+    await app_start_with()
+    if settings.UPDATE_SHARDS:
+        update_scheduler.start()
+    try:
+        await consumer.run()
+    finally:
+        if settings.UPDATE_SHARDS:
+            await update_scheduler.stop()
+        await app_stop_with()
+
+
+if __name__ == "__main__":
+    asyncio.run(start_worker())
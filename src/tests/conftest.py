@@ -0,0 +1,18 @@
+import os
+
+# data.config reads the settings from the environment at import time, tests need only placeholders
+for key, value in {
+    "TOKEN": "123456789:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA",
+    "ADMIN_ID": "1",
+    "REDIS_HOST": "localhost",
+    "REDIS_PASSWORD": "redis",
+    "REDIS_PORT": "6379",
+    "POSTGRES_HOST": "localhost",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_DATABASE": "postgres",
+    "POSTGRES_USER": "postgres",
+    "POSTGRES_PASSWORD": "postgres",
+    "DOMAIN": "example.com",
+    "WEBHOOK_PATH": "/webhook",
+}.items():
+    os.environ.setdefault(key, value)
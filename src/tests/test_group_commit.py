@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from repository.crud import cache
+from repository.crud.cache import RedisRowCache
+from repository.crud.group_commit import group_committer
+from repository.crud.users import UserRepo
+from repository.models.user import User
+from repository.routing import RoutingSession
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("aiosqlite")
+
+
+@pytest.fixture
+def run_handler(tmp_path, monkeypatch):
+    redis = fakeredis.FakeAsyncRedis()
+    monkeypatch.setitem(cache.row_caches, User, RedisRowCache(User, ttl=UserRepo.cache_ttl, redis=redis))
+    monkeypatch.setattr(cache.invalidator, "redis", redis)
+    monkeypatch.setattr(UserRepo, "group_commit", True)
+    monkeypatch.setattr(group_committer, "batches", 0)
+
+    def run(handler):
+        async def scenario():
+            # a file, so the batch and the handler use different connections like with a real database
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite'}")
+            async with engine.begin() as connection:
+                await connection.run_sync(User.metadata.create_all, tables=[User.__table__])
+            sessions = async_sessionmaker(engine, expire_on_commit=False, sync_session_class=RoutingSession)
+            monkeypatch.setattr(group_committer, "session_factory", sessions)
+            try:
+                async with sessions() as session:
+                    session.add_all([User(telegram_id=1, username="a"), User(telegram_id=2, username="b")])
+                    await session.commit()
+                async with sessions() as session:
+                    await handler(UserRepo(session))
+                async with sessions() as session:
+                    return list(await session.scalars(select(User.username).order_by(User.telegram_id)))
+            finally:
+                await engine.dispose()
+
+        return asyncio.run(scenario())
+
+    return run
+
+
+def test_write_after_read_is_grouped(run_handler):
+    async def handler(user_repo):
+        user = await user_repo.get(User.username == "a")
+        assert user_repo.async_session.in_transaction()
+        await user_repo.update(User.telegram_id == user.telegram_id, username="c")
+
+    assert run_handler(handler) == ["c", "b"]
+    assert group_committer.batches == 1
+
+
+def test_write_after_write_is_not_grouped(run_handler):
+    async def handler(user_repo):
+        await user_repo.update(User.telegram_id == 1, username="c", commit=False)
+        await user_repo.update(User.telegram_id == 2, username="d")
+
+    assert run_handler(handler) == ["c", "d"]
+    assert group_committer.batches == 0
@@ -0,0 +1,65 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from repository.query_stats import QueryBudgetExceeded, QueryStats, assert_queries, fingerprint
+
+
+@pytest.mark.parametrize("statement", [
+    "SELECT users.telegram_id FROM users WHERE users.telegram_id IN (%(id_1)s, %(id_2)s, %(id_3)s)",
+    "SELECT users.telegram_id FROM users WHERE users.telegram_id IN ($1::BIGINT, $2::BIGINT)",
+    "SELECT users.telegram_id FROM users WHERE users.telegram_id IN ($1::BIGINT, $2::BIGINT, $3::BIGINT)",
+])
+def test_in_lists_of_any_length_share_fingerprint(statement):
+    assert fingerprint(statement) == "SELECT users.telegram_id FROM users WHERE users.telegram_id IN (...)"
+
+
+def test_in_list_casts_with_arguments():
+    statement = "SELECT users.telegram_id FROM users WHERE users.username IN ($1::VARCHAR(32), $2::VARCHAR(32))"
+    assert fingerprint(statement) == "SELECT users.telegram_id FROM users WHERE users.username IN (...)"
+
+
+def test_literals_and_whitespace_are_normalized():
+    assert fingerprint("SELECT  1 FROM users\n WHERE username = 'alice'") == "SELECT ? FROM users WHERE username = ?"
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    QueryStats().instrument(engine)
+    yield engine
+    engine.dispose()
+
+
+def test_assert_queries_records_statements(engine):
+    with assert_queries(max_statements=3) as recorder:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            connection.execute(text("SELECT :value"), {"value": 2})
+
+    assert recorder.statements == 2
+    assert recorder.fingerprints == {"SELECT ?": 2}
+
+
+def test_assert_queries_raises_over_budget(engine):
+    with pytest.raises(QueryBudgetExceeded, match="3 statements"):
+        with assert_queries(max_statements=2):
+            with engine.connect() as connection:
+                for _ in range(3):
+                    connection.execute(text("SELECT 1"))
+
+
+def test_assert_queries_detects_repeats(engine):
+    with pytest.raises(QueryBudgetExceeded, match="possible N\\+1"):
+        with assert_queries(max_repeats=1):
+            with engine.connect() as connection:
+                for user_id in range(3):
+                    connection.execute(text("SELECT :user_id"), {"user_id": user_id})
+
+
+def test_statements_outside_block_are_not_recorded(engine):
+    with engine.connect() as connection:
+        with assert_queries() as recorder:
+            connection.execute(text("SELECT 1"))
+        connection.execute(text("SELECT 2"))
+
+    assert recorder.statements == 1
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from repository.crud import cache
+from repository.crud.cache import RedisRowCache
+from repository.crud.users import UserRepo
+from repository.models.user import User
+from repository.routing import RoutingSession
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("aiosqlite")
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    redis = fakeredis.FakeAsyncRedis()
+    row_cache = RedisRowCache(User, ttl=UserRepo.cache_ttl, local_ttl=UserRepo.local_cache_ttl, redis=redis)
+    monkeypatch.setitem(cache.row_caches, User, row_cache)
+    monkeypatch.setattr(cache.invalidator, "redis", redis)
+    return redis
+
+
+def run_with_sessions(scenario, **session_options):
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as connection:
+            await connection.run_sync(User.metadata.create_all, tables=[User.__table__])
+        sessions = async_sessionmaker(engine, expire_on_commit=False, sync_session_class=RoutingSession)
+        async with sessions() as session:
+            session.add(User(telegram_id=1, username="a"))
+            await session.commit()
+        try:
+            return await scenario(async_sessionmaker(engine, **{"sync_session_class": RoutingSession, **session_options}))
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(run())
+
+
+def test_cached_get_keeps_unflushed_changes(redis):
+    async def scenario(sessions):
+        async with sessions(expire_on_commit=False) as session:
+            user_repo = UserRepo(session)
+            user = await user_repo.get(telegram_id=1)
+            user.username = "changed"
+            again = await user_repo.get(telegram_id=1)
+            return user, again
+
+    user, again = run_with_sessions(scenario)
+    assert again is user
+    assert again.username == "changed"
+
+
+def test_fill_does_not_overwrite_written_row(redis):
+    async def scenario(sessions):
+        async with sessions(expire_on_commit=False) as session:
+            stale = await session.get(User, 1)
+            async with sessions(expire_on_commit=False) as writer:
+                await UserRepo(writer).update(telegram_id=1, username="new")
+            await cache.row_caches[User].set_many([stale], fill=True)
+        async with sessions(expire_on_commit=False) as session:
+            return (await UserRepo(session).get(telegram_id=1)).username
+
+    assert run_with_sessions(scenario) == "new"
+
+
+def test_commit_with_expired_instance_invalidates_row(redis):
+    async def scenario(sessions):
+        async with sessions(expire_on_commit=False) as session:
+            await UserRepo(session).get(telegram_id=1)
+        async with sessions(expire_on_commit=True) as session:
+            await UserRepo(session).update(telegram_id=1, username="new")
+        return await redis.get(cache.row_caches[User].key(1))
+
+    assert run_with_sessions(scenario) is None
@@ -0,0 +1,157 @@
+import asyncio
+import contextlib
+import heapq
+import itertools
+import logging
+import time
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from data.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """
+    The update is shed: the worker is at its in-flight limit and the update could not wait for a slot
+    """
+
+
+class _Waiter:
+    __slots__ = ("priority", "order", "update_type", "future")
+
+    def __init__(self, priority: int, order: int, update_type: str, future: asyncio.Future):
+        self.priority = priority
+        self.order = order
+        self.update_type = update_type
+        self.future = future
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.order) < (other.priority, other.order)
+
+
+class AdmissionControl:
+    """
+    Admission control of one worker process: at most `max_in_flight` updates are handled at once.
+    Other updates wait for a free slot for at most `max_wait` seconds, and at most `max_waiting` of them;
+    a freed slot goes to the most important waiting update (the lowest priority number, see `priorities`).
+    When the waiting line is full, a more important update displaces the least important waiting one.
+    Updates that time out or are displaced are shed with `Overloaded`, so the webhook answers at once
+    and Telegram redelivers them later instead of the worker piling up requests.
+    """
+
+    def __init__(
+            self,
+            max_in_flight: Optional[int] = settings.WEBHOOK_MAX_IN_FLIGHT,
+            max_waiting: int = settings.WEBHOOK_MAX_WAITING,
+            max_wait: float = settings.WEBHOOK_MAX_QUEUE_WAIT,
+            priorities: Optional[Dict[str, int]] = None,
+            default_priority: int = settings.WEBHOOK_DEFAULT_PRIORITY,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self.priorities = settings.WEBHOOK_UPDATE_PRIORITIES if priorities is None else priorities
+        self.default_priority = default_priority
+        self.in_flight = 0
+        self.max_seen_in_flight = 0
+        self.admitted = 0
+        self.waited = 0
+        self.wait_seconds = 0.0
+        self.shed: Counter[str] = Counter()
+        self.shed_reasons: Counter[str] = Counter()
+        self._waiters: List[_Waiter] = []
+        self._order = itertools.count()
+
+    def priority(self, update_type: str) -> int:
+        return self.priorities.get(update_type, self.default_priority)
+
+    @contextlib.asynccontextmanager
+    async def admit(self, update_type: str) -> AsyncIterator[None]:
+        """
+        Hold a slot while the update is handled, raise `Overloaded` if it is shed
+
+        Examples:
+            try:\n
+                async with admission_control.admit(update.event_type):\n
+                    await dp.feed_webhook_update(bot=bot, update=update)\n
+            except Overloaded:\n
+                response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        """
+        await self._acquire(update_type)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, update_type: str) -> None:
+        if self.max_in_flight is None or (self.in_flight < self.max_in_flight and not self._waiters):
+            self._take_slot()
+            return
+
+        priority = self.priority(update_type)
+        if len(self._waiters) >= self.max_waiting:
+            least = max(self._waiters) if self._waiters else None
+            if least is None or least.priority <= priority:
+                raise self._shed(update_type, "queue_full")
+            self._remove(least)
+            least.future.set_exception(self._shed(least.update_type, "displaced"))
+
+        waiter = _Waiter(priority, next(self._order), update_type, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, waiter)
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter.future, timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self._remove(waiter)
+            raise self._shed(update_type, "deadline")
+        except asyncio.CancelledError:
+            # the request is gone, a slot handed over meanwhile goes to the next waiter
+            self._remove(waiter)
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                self._release()
+            raise
+        self.waited += 1
+        self.wait_seconds += time.perf_counter() - started
+
+    def _take_slot(self) -> None:
+        self.in_flight += 1
+        self.admitted += 1
+        self.max_seen_in_flight = max(self.max_seen_in_flight, self.in_flight)
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        while self._waiters:
+            waiter = heapq.heappop(self._waiters)
+            if not waiter.future.done():
+                self._take_slot()
+                waiter.future.set_result(None)
+                return
+
+    def _remove(self, waiter: _Waiter) -> None:
+        with contextlib.suppress(ValueError):
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+
+    def _shed(self, update_type: str, reason: str) -> Overloaded:
+        self.shed[update_type] += 1
+        self.shed_reasons[reason] += 1
+        logger.debug(f"Update of type {update_type} is shed: {reason}")
+        return Overloaded(reason)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "max_seen_in_flight": self.max_seen_in_flight,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "avg_wait_ms": self.wait_seconds / self.waited * 1000 if self.waited else 0.0,
+            "shed": sum(self.shed.values()),
+            "shed_by_type": dict(self.shed),
+            "shed_by_reason": dict(self.shed_reasons),
+        }
+
+
+admission_control: AdmissionControl = AdmissionControl()
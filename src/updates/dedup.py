@@ -0,0 +1,165 @@
+import asyncio
+import collections
+import contextlib
+import logging
+from typing import Any, AsyncIterator, Deque, Dict, Set
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from bot import bot
+from data.config import settings
+from repository.redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+# middleware data key, True for an update redelivered on purpose (a stream entry reclaimed from a failed
+# or crashed worker): its id was seen, so it is dropped only if it was handled
+REDELIVERED = "update_redelivered"
+
+# values of the Redis keys: the update is being handled (the lease) or it is handled
+_CLAIMED = 0
+_HANDLED = 1
+
+
+class UpdateDeduplicator:
+    """
+    Drops updates Telegram delivers more than once (after a slow response or a restart).
+    Recent update ids of this process are kept in a ring buffer, so most duplicates are dropped without
+    a Redis call; the first delivery is claimed atomically in Redis (SET NX), so a duplicate
+    is dropped whichever worker process receives it.
+
+    The claim is a short lease (`lease` seconds), renewed while the update is handled (see `handling`):
+    if the worker crashes, the redelivery is accepted once the lease runs out. A handled update is
+    remembered for `ttl` seconds, a failed one is released.
+    """
+
+    def __init__(
+            self,
+            redis: Redis = redis_client,
+            lease: int = settings.UPDATE_DEDUP_LEASE,
+            ttl: int = settings.UPDATE_DEDUP_TTL,
+            ring_size: int = settings.UPDATE_DEDUP_RING_SIZE,
+            prefix: str = f"updates:seen:{bot.id}",
+    ):
+        self.redis = redis
+        self.lease = lease
+        self.ttl = ttl
+        self.prefix = prefix
+        self.duplicates = 0
+        self.local_duplicates = 0
+        self.errors = 0
+        self._recent_ids: Deque[int] = collections.deque(maxlen=ring_size)
+        self._recent_set: Set[int] = set()
+
+    def key(self, update_id: int) -> str:
+        return f"{self.prefix}:{update_id}"
+
+    async def is_duplicate(self, update_id: int) -> bool:
+        """
+        Return True for a redelivery, otherwise claim the update for `lease` seconds
+        """
+        if update_id in self._recent_set:
+            self.duplicates += 1
+            self.local_duplicates += 1
+            return True
+        self._remember(update_id)
+
+        try:
+            claimed = await self.redis.set(self.key(update_id), _CLAIMED, nx=True, ex=self.lease)
+        except RedisError as e:
+            # better to handle an update twice than to lose it
+            self.errors += 1
+            logger.warning(f"Update deduplication of {update_id} failed: {e}")
+            return False
+
+        if not claimed:
+            self.duplicates += 1
+            return True
+        return False
+
+    async def is_handled(self, update_id: int) -> bool:
+        """
+        Return True if the update was handled (not only claimed), for redeliveries of seen updates
+        """
+        try:
+            value = await self.redis.get(self.key(update_id))
+        except RedisError as e:
+            self.errors += 1
+            logger.warning(f"Update deduplication of {update_id} failed: {e}")
+            return False
+        if value is None or int(value) != _HANDLED:
+            return False
+        self.duplicates += 1
+        return True
+
+    @contextlib.asynccontextmanager
+    async def handling(self, update_id: int) -> AsyncIterator[None]:
+        """
+        Hold the claim of the update while it is handled in the block, then mark it handled,
+        or release it if the block raises
+
+        Examples:
+            if not await update_deduplicator.is_duplicate(update.update_id):\n
+                async with update_deduplicator.handling(update.update_id):\n
+                    await dp.feed_update(bot, update)
+        """
+        renewal = asyncio.create_task(self._renew(update_id))
+        try:
+            yield
+        except BaseException:
+            renewal.cancel()
+            await self.forget(update_id)
+            raise
+        renewal.cancel()
+        await self.complete(update_id)
+
+    async def complete(self, update_id: int) -> None:
+        """
+        Remember the handled update for `ttl` seconds
+        """
+        try:
+            await self.redis.set(self.key(update_id), _HANDLED, ex=self.ttl)
+        except RedisError as e:
+            self.errors += 1
+            logger.warning(f"Update {update_id} is not marked as handled: {e}")
+
+    async def forget(self, update_id: int) -> None:
+        """
+        Release the update id, when the update is rejected or failed and has to be accepted on redelivery
+        """
+        if update_id in self._recent_set:
+            self._recent_set.discard(update_id)
+            self._recent_ids.remove(update_id)
+        try:
+            await self.redis.delete(self.key(update_id))
+        except RedisError as e:
+            self.errors += 1
+            logger.warning(f"Release of update {update_id} failed: {e}")
+
+    async def _renew(self, update_id: int) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await self.redis.expire(self.key(update_id), self.lease)
+            except RedisError as e:
+                self.errors += 1
+                logger.warning(f"Lease of update {update_id} is not renewed: {e}")
+
+    def _remember(self, update_id: int) -> None:
+        if len(self._recent_ids) == self._recent_ids.maxlen:
+            self._recent_set.discard(self._recent_ids[0])
+        self._recent_ids.append(update_id)
+        self._recent_set.add(update_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "duplicates": self.duplicates,
+            "local_duplicates": self.local_duplicates,
+            "redis_duplicates": self.duplicates - self.local_duplicates,
+            "errors": self.errors,
+            "recent_ids": len(self._recent_set),
+        }
+
+
+update_deduplicator: UpdateDeduplicator = UpdateDeduplicator()
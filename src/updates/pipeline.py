@@ -0,0 +1,8 @@
+from typing import Union
+
+from data.config import settings
+from updates.queue import UpdateQueue, update_queue
+from updates.scheduler import UpdateScheduler, update_scheduler
+
+# What the fast-ack webhook hands updates to: per-chat ordered shards or a plain worker pool
+update_pipeline: Union[UpdateScheduler, UpdateQueue] = update_scheduler if settings.UPDATE_SHARDS else update_queue
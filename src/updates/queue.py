@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from bot import bot, dp
+from data.config import settings
+from outbound.replies import send_reply
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateQueue:
+    """
+    Bounded in-process queue of updates drained by a pool of worker tasks, so the webhook endpoint
+    can answer Telegram as soon as an update is accepted instead of waiting for its handler.
+    """
+
+    def __init__(
+            self,
+            dispatcher: Dispatcher = dp,
+            bot: Bot = bot,
+            maxsize: int = settings.WEBHOOK_QUEUE_SIZE,
+            workers: int = settings.WEBHOOK_QUEUE_WORKERS,
+    ):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.workers = workers
+        self.enqueued = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.wait_seconds = 0.0
+        self._queue: asyncio.Queue[Tuple[float, Update]] = asyncio.Queue(maxsize=maxsize)
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = settings.WEBHOOK_QUEUE_DRAIN_TIMEOUT) -> None:
+        """
+        Let the workers finish the queued updates (for at most `timeout` seconds), then stop them
+        """
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Update queue is not drained in {timeout} s, {self._queue.qsize()} updates are dropped")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def put_nowait(self, update: Update) -> bool:
+        """
+        Queue the update, return False if the queue is full (the update is to be redelivered by Telegram)
+        """
+        try:
+            self._queue.put_nowait((time.perf_counter(), update))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    async def _work(self) -> None:
+        while True:
+            queued_at, update = await self._queue.get()
+            self.wait_seconds += time.perf_counter() - queued_at
+            try:
+                await send_reply(self.bot, await self.dispatcher.feed_update(self.bot, update))
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception(f"Update {update.update_id} failed")
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        handled = self.processed + self.failed
+        return {
+            "depth": self._queue.qsize(),
+            "max_depth": self.max_depth,
+            "maxsize": self._queue.maxsize,
+            "workers": len(self._tasks),
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+            "avg_wait_ms": self.wait_seconds / handled * 1000 if handled else 0.0,
+        }
+
+
+update_queue: UpdateQueue = UpdateQueue()
@@ -0,0 +1,189 @@
+import asyncio
+import collections
+import logging
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, OrderedDict, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.types import Update
+
+from bot import bot, dp
+from data.config import settings
+from outbound.replies import send_reply
+
+logger = logging.getLogger(__name__)
+
+Process = Callable[[], Awaitable[Any]]
+Job = Tuple[float, Update, Process]
+
+
+class Shard:
+    """
+    Updates of the chats hashed to one shard. Every chat has its own FIFO, chats take turns, so a very active
+    chat delays only its own updates, not the other chats of the shard.
+    """
+
+    def __init__(self, index: int, size: int):
+        self.index = index
+        self.size = size
+        self.pending = 0
+        self.chats: OrderedDict[Any, Deque[Job]] = collections.OrderedDict()
+        self.ready = asyncio.Event()
+        self.space = asyncio.Event()
+        self.processed = 0
+        self.lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+        self.last_lag_seconds = 0.0
+
+    def push(self, key: Any, job: Job) -> None:
+        self.chats.setdefault(key, collections.deque()).append(job)
+        self.pending += 1
+        self.ready.set()
+
+    def pop(self) -> Job:
+        key, jobs = self.chats.popitem(last=False)
+        job = jobs.popleft()
+        if jobs:
+            # to the end of the line, after the other chats of the shard
+            self.chats[key] = jobs
+        return job
+
+    def observe_lag(self, seconds: float) -> None:
+        self.processed += 1
+        self.lag_seconds += seconds
+        self.last_lag_seconds = seconds
+        self.max_lag_seconds = max(self.max_lag_seconds, seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self.pending,
+            "chats": len(self.chats),
+            "processed": self.processed,
+            "avg_lag_ms": self.lag_seconds / self.processed * 1000 if self.processed else 0.0,
+            "max_lag_ms": self.max_lag_seconds * 1000,
+            "last_lag_ms": self.last_lag_seconds * 1000,
+        }
+
+
+class UpdateScheduler:
+    """
+    Handles updates of one chat strictly in order and updates of different chats in parallel: updates are
+    hashed by chat (by user if there is no chat) into `shards` queues, each drained by its own worker task.
+    A shard holds at most `shard_queue_size` updates and one chat at most `chat_queue_size` of them.
+    """
+
+    def __init__(
+            self,
+            dispatcher: Dispatcher = dp,
+            bot: Bot = bot,
+            shards: int = settings.UPDATE_SHARDS,
+            shard_queue_size: int = settings.UPDATE_SHARD_QUEUE_SIZE,
+            chat_queue_size: int = settings.UPDATE_CHAT_QUEUE_SIZE,
+    ):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.chat_queue_size = chat_queue_size
+        self.shards = [Shard(index, shard_queue_size) for index in range(max(shards, 1))]
+        self.enqueued = 0
+        self.rejected = 0
+        self.failed = 0
+        self._unfinished = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks: List[asyncio.Task] = []
+
+    @staticmethod
+    def key(update: Update) -> Any:
+        context = UserContextMiddleware.resolve_event_context(update)
+        if context.chat_id is not None:
+            return context.chat_id
+        if context.user_id is not None:
+            return context.user_id
+        return update.update_id
+
+    def shard(self, key: Any) -> Shard:
+        return self.shards[hash(key) % len(self.shards)]
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._work(shard)) for shard in self.shards]
+
+    async def stop(self, timeout: float = settings.WEBHOOK_QUEUE_DRAIN_TIMEOUT) -> None:
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Update scheduler is not drained in {timeout} s, {self._unfinished} updates are dropped")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def put_nowait(self, update: Update, process: Optional[Process] = None) -> bool:
+        """
+        Schedule the update, return False if its shard or its chat has no room left.
+        `process` handles the update (by default it is fed to the dispatcher).
+        """
+        key = self.key(update)
+        shard = self.shard(key)
+        jobs = shard.chats.get(key)
+        if shard.pending >= shard.size or (jobs is not None and len(jobs) >= self.chat_queue_size):
+            self.rejected += 1
+            return False
+        self._push(shard, key, update, process)
+        return True
+
+    async def put(self, update: Update, process: Optional[Process] = None) -> None:
+        """
+        Schedule the update, waiting for room in its shard (for sources that can't redeliver, like polling)
+        """
+        key = self.key(update)
+        shard = self.shard(key)
+        while shard.pending >= shard.size:
+            shard.space.clear()
+            await shard.space.wait()
+        self._push(shard, key, update, process)
+
+    def _push(self, shard: Shard, key: Any, update: Update, process: Optional[Process]) -> None:
+        if process is None:
+            process = lambda: self.dispatcher.feed_update(self.bot, update)  # noqa: E731
+        shard.push(key, (time.perf_counter(), update, process))
+        self.enqueued += 1
+        self._unfinished += 1
+        self._idle.clear()
+
+    async def _work(self, shard: Shard) -> None:
+        while True:
+            while not shard.chats:
+                shard.ready.clear()
+                await shard.ready.wait()
+
+            queued_at, update, process = shard.pop()
+            shard.observe_lag(time.perf_counter() - queued_at)
+            try:
+                await send_reply(self.bot, await process())
+            except Exception:
+                self.failed += 1
+                logger.exception(f"Update {update.update_id} failed")
+            finally:
+                shard.pending -= 1
+                shard.space.set()
+                self._unfinished -= 1
+                if not self._unfinished:
+                    self._idle.set()
+
+    def stats(self) -> Dict[str, Any]:
+        shards = [shard.stats() for shard in self.shards]
+        return {
+            "depth": self._unfinished,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "max_lag_ms": max(shard["max_lag_ms"] for shard in shards),
+            "shards": shards,
+        }
+
+
+update_scheduler: UpdateScheduler = UpdateScheduler()
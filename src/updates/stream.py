@@ -0,0 +1,322 @@
+import asyncio
+import logging
+import os
+import socket
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from pydantic import ValidationError
+from redis.asyncio import Redis
+from redis.exceptions import RedisError, ResponseError
+
+from bot import bot, dp
+from data.config import settings
+from outbound.replies import send_reply
+from repository.redis import redis_client
+from updates.dedup import REDELIVERED
+from updates.scheduler import UpdateScheduler
+
+logger = logging.getLogger(__name__)
+
+# field of a stream entry holding the raw update (the webhook request body)
+UPDATE_FIELD = b"update"
+
+Entry = Tuple[bytes, Dict[bytes, bytes]]
+
+
+class UpdateStream:
+    """
+    Ingress side of the durable pipeline: the webhook appends raw updates to a Redis Stream
+    (trimmed to about `maxlen` entries) and answers Telegram, workers of `UpdateStreamConsumer` handle them.
+    """
+
+    def __init__(
+            self,
+            redis: Redis = redis_client,
+            name: str = settings.UPDATE_STREAM_NAME,
+            group: str = settings.UPDATE_STREAM_GROUP,
+            maxlen: int = settings.UPDATE_STREAM_MAXLEN,
+    ):
+        self.redis = redis
+        self.name = name
+        self.group = group
+        self.maxlen = maxlen
+        self.appended = 0
+        self.errors = 0
+
+    async def append(self, body: bytes) -> bool:
+        """
+        Append the raw update, return False if Redis is unavailable (the update is to be redelivered by Telegram)
+        """
+        try:
+            await self.redis.xadd(self.name, {UPDATE_FIELD: body}, maxlen=self.maxlen, approximate=True)
+        except RedisError as e:
+            self.errors += 1
+            logger.error(f"Update is not appended to stream {self.name}: {e}")
+            return False
+        self.appended += 1
+        return True
+
+    async def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {"appended": self.appended, "errors": self.errors}
+        try:
+            stats["length"] = await self.redis.xlen(self.name)
+            groups = await self.redis.xinfo_groups(self.name)
+        except RedisError as e:
+            # the stream does not exist before the first update or worker
+            logger.debug(f"Stream {self.name} info failed: {e}")
+            return stats
+        for group in groups:
+            if group["name"].decode() == self.group:
+                stats.update(consumers=group["consumers"], pending=group["pending"], lag=group.get("lag"))
+        return stats
+
+
+update_stream: UpdateStream = UpdateStream()
+
+
+class UpdateStreamConsumer:
+    """
+    Worker side of the durable pipeline: reads updates from the stream through a consumer group and feeds
+    them to the dispatcher, at most `concurrency` at a time. An entry is acknowledged (XACK) only after
+    its update is handled, so updates of a crashed worker stay pending; entries idle for `claim_idle_ms`
+    are reclaimed (XAUTOCLAIM) by a live worker; a worker keeps resetting the idle time of the entries
+    it is still handling, so a slow update is not reclaimed. Reclaimed updates are dropped by
+    the deduplicator only if they were handled (their ids were seen on the first delivery anyway). An entry delivered `max_deliveries` times is moved
+    to the `<stream>:dead` stream instead of being retried forever. Consumers without pending entries
+    idle for `consumer_idle_ms` are deleted from the group.
+
+    With a scheduler, updates of one chat are handled in order within the worker.
+    """
+
+    def __init__(
+            self,
+            dispatcher: Dispatcher = dp,
+            bot: Bot = bot,
+            redis: Redis = redis_client,
+            name: str = settings.UPDATE_STREAM_NAME,
+            group: str = settings.UPDATE_STREAM_GROUP,
+            consumer: Optional[str] = settings.UPDATE_STREAM_CONSUMER,
+            concurrency: int = settings.UPDATE_STREAM_CONCURRENCY,
+            block_ms: int = settings.UPDATE_STREAM_BLOCK_MS,
+            claim_idle_ms: int = settings.UPDATE_STREAM_CLAIM_IDLE_MS,
+            max_deliveries: int = settings.UPDATE_STREAM_MAX_DELIVERIES,
+            consumer_idle_ms: int = settings.UPDATE_STREAM_CONSUMER_IDLE_MS,
+            scheduler: Optional[UpdateScheduler] = None,
+    ):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.redis = redis
+        self.name = name
+        self.dead_name = f"{name}:dead"
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        self.max_deliveries = max_deliveries
+        self.consumer_idle_ms = consumer_idle_ms
+        self.scheduler = scheduler
+        self.read = 0
+        self.claimed = 0
+        self.acked = 0
+        self.failed = 0
+        self.dead = 0
+        self.deleted_consumers = 0
+        self._slots = asyncio.Semaphore(concurrency)
+        self._handling: Set[asyncio.Task] = set()
+        self._in_flight: Set[bytes] = set()
+        self._stopping = asyncio.Event()
+
+    async def run(self, drain_timeout: float = settings.WEBHOOK_QUEUE_DRAIN_TIMEOUT) -> None:
+        """
+        Handle updates until `stop` is called, then wait (for at most `drain_timeout` seconds)
+        for the updates being handled. Unfinished ones stay pending and are reclaimed by other workers.
+        """
+        await self._create_group()
+        logger.info(f"Consumer {self.consumer} of group {self.group} reads stream {self.name}")
+        loops = [asyncio.create_task(loop()) for loop in (self._read, self._touch, self._reclaim)]
+        try:
+            await self._stopping.wait()
+        finally:
+            for task in loops:
+                task.cancel()
+            await asyncio.gather(*loops, return_exceptions=True)
+            if self._handling:
+                _, pending = await asyncio.wait(self._handling, timeout=drain_timeout)
+                if pending:
+                    logger.warning(f"{len(pending)} updates are left pending in stream {self.name}")
+                    for task in pending:
+                        task.cancel()
+            await self._delete_self()
+            logger.info(f"Consumer {self.consumer} stopped: {self.stats()}")
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    async def _create_group(self) -> None:
+        try:
+            await self.redis.xgroup_create(self.name, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _read(self) -> None:
+        while True:
+            await self._slots.acquire()
+            free = 1
+            # take as many entries as there are free slots
+            while not self._slots.locked():
+                await self._slots.acquire()
+                free += 1
+            try:
+                response = await self.redis.xreadgroup(
+                    self.group, self.consumer, {self.name: ">"}, count=free, block=self.block_ms
+                )
+            except RedisError as e:
+                logger.error(f"Reading stream {self.name} failed: {e}")
+                response = []
+                await asyncio.sleep(1)
+            entries = response[0][1] if response else []
+            self.read += len(entries)
+            self._dispatch(entries, redelivered=False)
+            for _ in range(free - len(entries)):
+                self._slots.release()
+
+    async def _touch(self) -> None:
+        while True:
+            await asyncio.sleep(self.claim_idle_ms / 1000 / 3)
+            if not self._in_flight:
+                continue
+            try:
+                # claiming own entries again resets their idle time (JUSTID does not count a delivery)
+                await self.redis.xclaim(
+                    self.name, self.group, self.consumer, min_idle_time=0,
+                    message_ids=list(self._in_flight), justid=True,
+                )
+            except RedisError as e:
+                logger.error(f"Entries of consumer {self.consumer} are not touched: {e}")
+
+    async def _reclaim(self) -> None:
+        while True:
+            try:
+                await self._reclaim_once()
+                await self._delete_idle_consumers()
+            except RedisError as e:
+                logger.error(f"Reclaiming entries of stream {self.name} failed: {e}")
+            await asyncio.sleep(self.claim_idle_ms / 1000 / 2)
+
+    async def _reclaim_once(self) -> None:
+        start = "0-0"
+        while True:
+            start, entries, *_ = await self.redis.xautoclaim(
+                self.name, self.group, self.consumer, min_idle_time=self.claim_idle_ms, start_id=start, count=100
+            )
+            entries = [(entry_id, fields) for entry_id, fields in entries if fields is not None]
+            if entries:
+                self.claimed += len(entries)
+                logger.warning(f"Reclaimed {len(entries)} stuck entries of stream {self.name}")
+                entries = await self._drop_dead(entries)
+                for _ in entries:
+                    await self._slots.acquire()
+                self._dispatch(entries, redelivered=True)
+            if start in (b"0-0", "0-0"):
+                return
+
+    async def _drop_dead(self, entries: List[Entry]) -> List[Entry]:
+        """
+        Move entries delivered `max_deliveries` times to the dead letter stream, return the others
+        """
+        deliveries = {}
+        for entry_id, _ in entries:
+            # stuck entries are rare, one call per entry is fine
+            pending = await self.redis.xpending_range(self.name, self.group, min=entry_id, max=entry_id, count=1)
+            deliveries[entry_id] = pending[0]["times_delivered"] if pending else 0
+        alive = []
+        for entry_id, fields in entries:
+            if deliveries.get(entry_id, 0) <= self.max_deliveries:
+                alive.append((entry_id, fields))
+                continue
+            self.dead += 1
+            logger.error(f"Entry {entry_id.decode()} of stream {self.name} failed {self.max_deliveries} times")
+            await self.redis.xadd(self.dead_name, fields, maxlen=settings.UPDATE_STREAM_MAXLEN, approximate=True)
+            await self._ack(entry_id)
+        return alive
+
+    async def _delete_idle_consumers(self) -> None:
+        for consumer in await self.redis.xinfo_consumers(self.name, self.group):
+            name = consumer["name"].decode()
+            # entries of a gone consumer are reclaimed first, it is deleted once it has none
+            if name != self.consumer and consumer["pending"] == 0 and consumer["idle"] > self.consumer_idle_ms:
+                await self.redis.xgroup_delconsumer(self.name, self.group, name)
+                self.deleted_consumers += 1
+                logger.info(f"Idle consumer {name} is deleted from group {self.group}")
+
+    async def _delete_self(self) -> None:
+        # consumer names are unique per process, a stopped worker would be left in the group forever
+        try:
+            consumers = await self.redis.xinfo_consumers(self.name, self.group)
+            if any(c["name"].decode() == self.consumer and c["pending"] == 0 for c in consumers):
+                await self.redis.xgroup_delconsumer(self.name, self.group, self.consumer)
+        except RedisError as e:
+            logger.warning(f"Consumer {self.consumer} is not deleted from group {self.group}: {e}")
+
+    def _dispatch(self, entries: List[Entry], redelivered: bool) -> None:
+        for entry_id, fields in entries:
+            self._in_flight.add(entry_id)
+            task = asyncio.create_task(self._handle(entry_id, fields, redelivered))
+            self._handling.add(task)
+            task.add_done_callback(self._handling.discard)
+
+    async def _handle(self, entry_id: bytes, fields: Dict[bytes, bytes], redelivered: bool) -> None:
+        try:
+            try:
+                update = Update.model_validate_json(fields[UPDATE_FIELD], context={"bot": self.bot})
+            except (KeyError, ValidationError) as e:
+                # a retry would not fix it
+                logger.error(f"Invalid update in entry {entry_id.decode()} is skipped: {e}")
+                self._in_flight.discard(entry_id)
+                await self._ack(entry_id)
+                return
+
+            if self.scheduler is not None:
+                # the slot is released once the update is scheduled, the scheduler bounds the rest
+                await self.scheduler.put(update, lambda: self._process(entry_id, update, redelivered))
+            else:
+                await self._process(entry_id, update, redelivered)
+        finally:
+            self._slots.release()
+
+    async def _process(self, entry_id: bytes, update: Update, redelivered: bool) -> None:
+        try:
+            result = await self.dispatcher.feed_update(self.bot, update, **{REDELIVERED: redelivered})
+            await send_reply(self.bot, result)
+        except Exception:
+            self.failed += 1
+            logger.exception(f"Update {update.update_id} failed, it is left pending to be retried")
+        else:
+            await self._ack(entry_id)
+        finally:
+            # a failed entry is no longer touched, so it goes idle and is reclaimed
+            self._in_flight.discard(entry_id)
+
+    async def _ack(self, entry_id: bytes) -> None:
+        try:
+            await self.redis.xack(self.name, self.group, entry_id)
+        except RedisError as e:
+            # the entry is reclaimed, the deduplicator drops it then as an already handled update
+            logger.warning(f"Entry {entry_id.decode()} of stream {self.name} is not acknowledged: {e}")
+            return
+        self.acked += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "consumer": self.consumer,
+            "read": self.read,
+            "claimed": self.claimed,
+            "acked": self.acked,
+            "failed": self.failed,
+            "dead": self.dead,
+            "deleted_consumers": self.deleted_consumers,
+            "handling": len(self._handling),
+        }
@@ -10,6 +10,7 @@ from content.middlewares.middleware import register_middlewares
 from data.config import settings
 from logs import logging_config
 from management import app_start_with, app_stop_with
+from updates.pipeline import update_pipeline
 
 dictConfig(logging_config)
 
@@ -23,6 +24,10 @@ def initialize_app() -> FastAPI:
 
     tb_app.add_event_handler("startup", app_start_with)
     tb_app.add_event_handler("shutdown", app_stop_with)
+    if settings.WEBHOOK_FAST_ACK:
+        tb_app.add_event_handler("startup", update_pipeline.start)
+        # queued updates are handled before the database and the bot session are closed
+        tb_app.router.on_shutdown.insert(0, update_pipeline.stop)
     tb_app.include_router(router=api_router)
 
     return tb_app